@@ -1,34 +1,87 @@
+from decimal import Decimal
+from django.conf import settings
 from django.contrib import admin
+from django.db.models import DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce
 from .models import Cart, CartItem
 
 class CartItemInline(admin.TabularInline):
     model = CartItem
     extra = 0
-    readonly_fields = ['get_total_price']
-    fields = ['product_name', 'product_price', 'quantity', 'get_total_price']
+    readonly_fields = ['line_total']
+    fields = ['product_name', 'product_price', 'quantity', 'line_total']
+    
+    def line_total(self, obj):
+        # The blank "add another" row has no price yet
+        if obj.product_price is None:
+            return '-'
+        return obj.get_total_price()
+    line_total.short_description = 'Total'
 
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
     list_display = ['user', 'get_total_items', 'get_formatted_total_price', 'updated_at']
+    list_select_related = ['user']
     list_filter = ['created_at', 'updated_at']
     search_fields = ['user__username', 'user__email']
     readonly_fields = ['created_at', 'updated_at', 'get_total_items', 'get_formatted_total_price']
     inlines = [CartItemInline]
     
+    def get_queryset(self, request):
+        # Totals come with the page query instead of two aggregates per row
+        queryset = super().get_queryset(request)
+        if getattr(settings, 'CART_DENORMALIZED_TOTALS', False):
+            return queryset.annotate(total_items=F('item_count'), total_price=F('subtotal'))
+        return queryset.annotate(
+            total_items=Coalesce(Sum('items__quantity'), Value(0)),
+            total_price=Coalesce(
+                Sum(F('items__product_price') * F('items__quantity'), output_field=DecimalField(max_digits=12, decimal_places=2)),
+                Value(Decimal('0.00')),
+                output_field=DecimalField(max_digits=12, decimal_places=2)
+            ),
+        )
+    
+    def get_total_items(self, obj):
+        return obj.total_items
+    get_total_items.short_description = 'Total Items'
+    get_total_items.admin_order_field = 'total_items'
+    
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Inline item edits change the denormalized totals
+        form.instance.refresh_totals()
+    
     def get_formatted_total_price(self, obj):
-        return f"₹{obj.get_total_price():.2f}"
+        return f"₹{obj.total_price:.2f}"
     get_formatted_total_price.short_description = 'Total Price'
+    get_formatted_total_price.admin_order_field = 'total_price'
 
 @admin.register(CartItem)
 class CartItemAdmin(admin.ModelAdmin):
     list_display = ['product_name', 'get_user', 'quantity', 'product_price', 'get_formatted_total_price', 'added_at']
+    list_select_related = ['cart__user']
     list_filter = ['added_at', 'cart__user']
     search_fields = ['product_name', 'cart__user__username']
     readonly_fields = ['added_at', 'updated_at', 'get_total_price']
     
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        obj.cart.refresh_totals()
+    
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        obj.cart.refresh_totals()
+    
+    def delete_queryset(self, request, queryset):
+        carts = list(Cart.objects.filter(items__in=queryset).distinct())
+        super().delete_queryset(request, queryset)
+        for cart in carts:
+            cart.refresh_totals()
+    
     def get_user(self, obj):
         return obj.cart.user.username
     get_user.short_description = 'User'
+    get_user.admin_order_field = 'cart__user__username'
     
     def get_formatted_total_price(self, obj):
         return f"₹{obj.get_total_price():.2f}"
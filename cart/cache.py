@@ -0,0 +1,28 @@
+"""
+Per-user cache of cart summaries used by the cart context processor
+"""
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+def cart_summary_key(user_id):
+    return f'cart:summary:{user_id}'
+
+
+def get_cart_summary(user):
+    """Return (item count, total price) for the user's cart, without ever creating one"""
+    key = cart_summary_key(user.pk)
+    summary = cache.get(key)
+    if summary is None:
+        from .models import Cart
+        cart = Cart.objects.filter(user=user).first()
+        summary = cart.get_totals() if cart else (0, Decimal('0.00'))
+        cache.set(key, summary, getattr(settings, 'CART_SUMMARY_CACHE_TTL', 300))
+    return summary
+
+
+def invalidate_cart_summary(user_id):
+    """Drop the cached summary once the surrounding transaction commits"""
+    transaction.on_commit(lambda: cache.delete(cart_summary_key(user_id)))
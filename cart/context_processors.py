@@ -1,39 +1,49 @@
 """
 Context processors for cart app
 """
+from decimal import Decimal
+from django.utils.functional import SimpleLazyObject, lazy
+from .cache import get_cart_summary
 
 def cart_context(request):
     """
-    Add cart information to all template contexts
+    Add cart information to all template contexts.
+
+    Values are lazy: pages that never show the cart run no cart queries,
+    and the count/total come from a per-user cache entry.
     """
     if request.user.is_authenticated:
-        try:
-            from .models import Cart
-            cart = Cart.objects.get(user=request.user)
-            return {
-                'cart': cart,
-                'cart_item_count': cart.get_total_items(),
-                'cart_total': cart.get_total_price(),
-            }
-        except Cart.DoesNotExist:
-            # Create empty cart for user
-            cart = Cart.objects.create(user=request.user)
-            return {
-                'cart': cart,
-                'cart_item_count': 0,
-                'cart_total': 0,
-            }
-        except Exception:
-            # Return empty cart context if any error occurs
-            return {
-                'cart': None,
-                'cart_item_count': 0,
-                'cart_total': 0,
-            }
+        user = request.user
+
+        def load_cart():
+            try:
+                from .models import Cart
+                return Cart.objects.filter(user=user).first()
+            except Exception:
+                return None
+
+        def load_summary():
+            try:
+                return get_cart_summary(user)
+            except Exception:
+                # Return empty cart summary if any error occurs
+                return (0, Decimal('0.00'))
+
+        summary = SimpleLazyObject(load_summary)
+        return {
+            'cart': SimpleLazyObject(load_cart),
+            'cart_item_count': lazy(lambda: summary[0], int)(),
+            'cart_total': lazy(lambda: summary[1], Decimal)(),
+        }
     else:
-        # For anonymous users, return empty cart context
+        # Anonymous users have a session cart at most; the session is only read if shown
+        def load_guest_summary():
+            from .guest import GuestCart
+            return GuestCart(request.session).get_totals()
+
+        summary = SimpleLazyObject(load_guest_summary)
         return {
             'cart': None,
-            'cart_item_count': 0,
-            'cart_total': 0,
+            'cart_item_count': lazy(lambda: summary[0], int)(),
+            'cart_total': lazy(lambda: summary[1], Decimal)(),
         }
\ No newline at end of file
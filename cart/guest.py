@@ -0,0 +1,200 @@
+"""
+Session-backed cart for anonymous visitors, merged into Cart on login
+"""
+from decimal import Decimal
+from django.contrib import messages
+from django.db import transaction
+from django.utils import timezone
+from .models import Cart, CartItem
+from .services import InsufficientStock, line_key, reservation_service, reservations_enabled, stock_service
+
+
+class GuestCartItem:
+    """A cart line kept in the session, shaped like CartItem for templates and views"""
+
+    def __init__(self, id, product_name, product_price, product_image, quantity):
+        self.id = id
+        self.product_name = product_name
+        self.product_price = Decimal(product_price)
+        self.product_image = product_image
+        self.quantity = quantity
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_name}"
+
+    def get_total_price(self):
+        """Calculate total price for this item (price × quantity)"""
+        return self.product_price * self.quantity
+
+
+class GuestCart:
+    """Cart stored in the session (use the signed_cookies engine for zero DB rows)"""
+    session_key = 'guest_cart'
+
+    def __init__(self, session):
+        self.session = session
+        self.data = session.get(self.session_key) or {'next_id': 1, 'version': 0, 'items': []}
+
+    @property
+    def version(self):
+        return self.data['version']
+
+    def get_items(self):
+        """Lines newest first, like CartItem ordering"""
+        return [GuestCartItem(**line) for line in reversed(self.data['items'])]
+
+    def get_item(self, item_id):
+        for line in self.data['items']:
+            if line['id'] == item_id:
+                return line
+        return None
+
+    def get_totals(self):
+        """Return (total items, total price)"""
+        items = self.get_items()
+        total_price = sum((item.get_total_price() for item in items), Decimal('0.00'))
+        return sum(item.quantity for item in items), total_price
+
+    def add(self, product_name, price, image, quantity):
+        """Add quantity units of a product, returning (item, created)"""
+        line = next((line for line in self.data['items'] if line['product_name'] == product_name), None)
+        in_cart = line['quantity'] if line else 0
+
+        available = stock_service.get_stock(product_name, fresh=True)
+        if available is not None and available < in_cart + quantity:
+            raise InsufficientStock(product_name, available, in_cart)
+
+        created = line is None
+        if created:
+            line = {'id': self.data['next_id'], 'product_name': product_name, 'quantity': 0}
+            self.data['next_id'] += 1
+            self.data['items'].append(line)
+        line['quantity'] += quantity
+        line['product_price'] = str(price)  # Update price in case it changed
+        line['product_image'] = image
+        self.save()
+        return GuestCartItem(**line), created
+
+    def set_quantity(self, item_id, quantity):
+        """Set a line's quantity (removing it at zero), None if the line does not exist"""
+        line = self.get_item(item_id)
+        if line is None:
+            return None
+        if quantity <= 0:
+            return self.remove(item_id)
+
+        available = stock_service.get_stock(line['product_name'], fresh=True)
+        if available is not None and available < quantity:
+            raise InsufficientStock(line['product_name'], available, line['quantity'])
+        line['quantity'] = quantity
+        self.save()
+        return GuestCartItem(**line)
+
+    def remove(self, item_id):
+        """Remove a line, returning it (None if it does not exist)"""
+        line = self.get_item(item_id)
+        if line is None:
+            return None
+        self.data['items'].remove(line)
+        self.save()
+        return GuestCartItem(**line)
+
+    def clear(self):
+        """Remove all items from cart"""
+        self.data['items'] = []
+        self.save()
+
+    def save(self):
+        self.data['version'] += 1
+        self.session[self.session_key] = self.data
+
+
+def hold_merged(cart, item):
+    """Hold stock for a merged line, shrinking it to what is left; returns the quantity held"""
+    quantity = item.quantity
+    while quantity > 0:
+        try:
+            with transaction.atomic():
+                reservation_service.hold(cart, item.product_name, quantity, item.product_id)
+            return quantity
+        except InsufficientStock as e:
+            # Another cart took stock since it was looked up
+            quantity = min(e.available, quantity - 1)
+    # Nothing fits, give back what the line held before
+    reservation_service.hold(cart, item.product_name, 0, item.product_id)
+    return 0
+
+
+def merge_guest_cart(request, user):
+    """
+    Fold the session cart into the user's Cart with bulk writes, capped by stock.
+
+    Lines that do not fit the stock are shrunk (or removed from the cart,
+    existing lines included) and the user is told with a message, logging in
+    never fails because of the stock.
+    """
+    guest_cart = GuestCart(request.session)
+    lines = guest_cart.get_items()
+    if not lines:
+        return
+
+    with transaction.atomic():
+        cart, created = Cart.objects.select_for_update().get_or_create(user=user)
+        existing = {}
+        for pk, product_name, product_id, quantity in cart.items.values_list('pk', 'product_name', 'product_id', 'quantity'):
+            existing[line_key(product_id, product_name)] = (pk, product_name, quantity)
+        found = stock_service.lookup(line.product_name for line in lines)
+        # Units the cart already holds count as available to it
+        held = stock_service.held(cart, [product_id for product_id, available in found.values()])
+
+        now = timezone.now()
+        merged = []
+        wanted = {}
+        for line in lines:
+            product_id, available = found.get(line.product_name, (None, None))
+            key = line_key(product_id, line.product_name)
+            # A renamed product still lands on its existing line, under its cart name
+            pk, product_name, in_cart = existing.get(key, (None, line.product_name, 0))
+            quantity = in_cart + line.quantity
+            wanted[product_name] = quantity
+            if available is not None:
+                quantity = min(quantity, available + held.get(product_id, 0))
+            if quantity > 0 or pk is not None:
+                merged.append(CartItem(
+                    pk=pk,
+                    cart=cart,
+                    product_name=product_name,
+                    product_id=product_id,
+                    product_price=line.product_price,
+                    product_image=line.product_image,
+                    quantity=max(quantity, 0),
+                    updated_at=now
+                ))
+
+        if reservations_enabled():
+            for item in merged:
+                item.quantity = hold_merged(cart, item)
+        removed = [item.pk for item in merged if item.quantity <= 0 and item.pk is not None]
+        merged = [item for item in merged if item.quantity > 0]
+
+        kept = {item.product_name: item.quantity for item in merged}
+        for product_name, quantity in wanted.items():
+            if kept.get(product_name, 0) < quantity:
+                notify_shortage(request, product_name, kept.get(product_name, 0))
+
+        # The cart row is locked, so no other request can add these lines in between
+        fields = ['quantity', 'product_price', 'product_image', 'updated_at']
+        CartItem.objects.bulk_update([item for item in merged if item.pk is not None], fields)
+        CartItem.objects.bulk_create([item for item in merged if item.pk is None])
+        CartItem.objects.filter(pk__in=removed).delete()
+        cart.refresh_totals()
+
+    guest_cart.clear()
+
+
+def notify_shortage(request, product_name, quantity):
+    if quantity:
+        message = f'Only {quantity} units of {product_name} are available, your cart was updated.'
+    else:
+        message = f'{product_name} is out of stock and was removed from your cart.'
+    messages.warning(request, message, fail_silently=True)
@@ -0,0 +1,24 @@
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from cart.models import Cart, CartItem
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized item_count/subtotal of every cart (run before enabling CART_DENORMALIZED_TOTALS)"
+
+    def handle(self, *args, **options):
+        items = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+        money = DecimalField(max_digits=12, decimal_places=2)
+        updated = Cart.objects.update(
+            item_count=Coalesce(Subquery(items.annotate(total=Sum('quantity')).values('total')), Value(0)),
+            subtotal=Coalesce(
+                Subquery(items.annotate(
+                    total=Sum(F('product_price') * F('quantity'), output_field=money)
+                ).values('total')),
+                Value(Decimal('0.00')),
+                output_field=money
+            ),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Refreshed totals for {updated} carts"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from cart.services import reservation_service
+
+
+class Command(BaseCommand):
+    help = "Give the stock of expired cart reservations back (schedule it every few minutes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Reservations released per transaction')
+
+    def handle(self, *args, **options):
+        released = reservation_service.release_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Released {released} expired reservations"))
@@ -0,0 +1,44 @@
+"""
+Link cart lines recorded before CartItem.product_id existed to their decor item
+"""
+from django.apps import apps as global_apps
+from django.db import migrations
+from django.db.models import Exists, F, OuterRef, Subquery
+
+
+def backfill_product_ids(apps, schema_editor):
+    try:
+        DecorItemsModel = apps.get_model('decor', 'DecorItemsModel')
+    except LookupError:
+        return  # Without the decor app there is nothing to link to
+    CartItem = apps.get_model('cart', 'CartItem')
+    ordering = DecorItemsModel._meta.ordering or ['pk']
+    matches = DecorItemsModel.objects.filter(item_name=OuterRef('product_name'))
+    # Same item the old per-name .first() lookup returned
+    product = Subquery(matches.order_by(*ordering).values('pk')[:1])
+
+    # A cart may already have a line for the same item, added under its pk since
+    # 0002; fold the old line into it rather than break the (cart, product_id) constraint
+    unlinked = CartItem.objects.filter(product_id__isnull=True).annotate(resolved_id=product)
+    linked = CartItem.objects.filter(cart=OuterRef('cart'), product_id=OuterRef('resolved_id'))
+    for line in unlinked.filter(Exists(linked)).values('pk', 'cart_id', 'resolved_id', 'quantity'):
+        CartItem.objects.filter(cart_id=line['cart_id'], product_id=line['resolved_id']).update(
+            quantity=F('quantity') + line['quantity']
+        )
+        CartItem.objects.filter(pk=line['pk']).delete()
+
+    CartItem.objects.filter(Exists(matches), product_id__isnull=True).update(product_id=product)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0002_product_ids_totals_and_reservations'),
+    ]
+    # decor is optional; when it is installed its table must exist before the backfill
+    if global_apps.is_installed('decor'):
+        dependencies.append(('decor', '__first__'))
+
+    operations = [
+        migrations.RunPython(backfill_product_ids, migrations.RunPython.noop),
+    ]
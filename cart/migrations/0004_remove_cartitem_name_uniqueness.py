@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:24
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0003_backfill_cartitem_product_ids'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='cartitem',
+            unique_together=set(),
+        ),
+    ]
@@ -1,33 +1,84 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import DecimalField, F, Sum
 from django.contrib.auth.models import User
 from decimal import Decimal
+from .cache import invalidate_cart_summary
 
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='cart')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized totals, kept in step by refresh_totals() on every item change
+    item_count = models.PositiveIntegerField(default=0, editable=False)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'), editable=False)
     
     class Meta:
         ordering = ['-updated_at']
+        indexes = [
+            # Lets the abandoned-cart purge walk idle carts as a range scan on (updated_at, id)
+            models.Index(fields=['updated_at', 'id'], name='cart_updated_at_id_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username}'s cart"
     
+    def compute_totals(self):
+        """Calculate (total items, total price) with a single aggregate query"""
+        totals = self.items.aggregate(
+            total_items=Sum('quantity'),
+            total_price=Sum(
+                F('product_price') * F('quantity'),
+                output_field=DecimalField(max_digits=12, decimal_places=2)
+            ),
+        )
+        total_price = totals['total_price'] or Decimal('0.00')
+        return totals['total_items'] or 0, total_price.quantize(Decimal('0.01'))
+    
+    def get_totals(self):
+        """Return (total items, total price), from the denormalized columns when enabled"""
+        if getattr(settings, 'CART_DENORMALIZED_TOTALS', False):
+            return self.item_count, self.subtotal
+        return self.compute_totals()
+    
     def get_total_items(self):
         """Calculate total number of items in cart"""
-        return sum(item.quantity for item in self.items.all())
+        return self.get_totals()[0]
     
     def get_total_price(self):
         """Calculate total price of all items in cart"""
-        return sum(item.get_total_price() for item in self.items.all())
+        return self.get_totals()[1]
+    
+    def refresh_totals(self):
+        """Recompute the denormalized totals, inside the transaction that changed the items"""
+        self.item_count, self.subtotal = self.compute_totals()
+        self.save(update_fields=['item_count', 'subtotal', 'updated_at'])
+        invalidate_cart_summary(self.user_id)
     
     def clear(self):
-        """Remove all items from cart"""
-        self.items.all().delete()
+        """
+        Remove all items from cart, once the order is placed.
+
+        Stock the cart still holds (with reservations) left with the order, so
+        the holds are consumed rather than handed back; to give the stock back
+        instead, release the holds before clearing.
+        """
+        from .services import reservation_service, reservations_enabled
+        with transaction.atomic():
+            if reservations_enabled():
+                reservation_service.consume(self)
+            self.items.all().delete()
+            self.item_count = 0
+            self.subtotal = Decimal('0.00')
+            self.save(update_fields=['item_count', 'subtotal', 'updated_at'])
+            invalidate_cart_summary(self.user_id)
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
     product_name = models.CharField(max_length=200)
+    # Primary key of the decor item, resolved from product_name when the line is created
+    # (None for products the decor app does not know); stock checks join on it
+    product_id = models.PositiveIntegerField(null=True, blank=True, editable=False)
     product_price = models.DecimalField(max_digits=10, decimal_places=2)
     product_image = models.URLField(max_length=500, blank=True)
     quantity = models.PositiveIntegerField(default=1)
@@ -36,11 +87,31 @@ class CartItem(models.Model):
     
     class Meta:
         ordering = ['-added_at']
-        unique_together = ['cart', 'product_name']
+        constraints = [
+            # Also the index for per-cart product lookups; NULLs (non-decor lines) never clash
+            models.UniqueConstraint(fields=['cart', 'product_id'], name='cartitem_cart_product_id_uniq'),
+        ]
     
     def __str__(self):
         return f"{self.quantity} x {self.product_name}"
     
     def get_total_price(self):
         """Calculate total price for this item (price × quantity)"""
-        return self.product_price * self.quantity
\ No newline at end of file
+        return self.product_price * self.quantity
+
+class StockReservation(models.Model):
+    """Decor stock held for a cart line until expires_at (with CART_STOCK_RESERVATIONS)"""
+    # SET_NULL so holds of a deleted cart are still released by the sweeper
+    cart = models.ForeignKey(Cart, on_delete=models.SET_NULL, null=True, related_name='reservations')
+    product_name = models.CharField(max_length=200)
+    # Primary key of the held decor item, holds are only taken for decor products
+    product_id = models.PositiveIntegerField()
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ['cart', 'product_id']
+    
+    def __str__(self):
+        return f"{self.quantity} x {self.product_name} held until {self.expires_at}"
\ No newline at end of file
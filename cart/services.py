@@ -0,0 +1,517 @@
+import json
+from collections import defaultdict
+from datetime import timedelta
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q, Subquery, Value
+from django.db.models.lookups import GreaterThanOrEqual
+from django.utils import timezone
+from .cache import cart_summary_key
+from .models import Cart, CartItem, StockReservation
+
+# Largest value a PositiveIntegerField holds on every supported backend
+MAX_QUANTITY = 2147483647
+
+
+class InsufficientStock(Exception):
+    """Raised when a cart change would exceed the available stock"""
+
+    def __init__(self, product_name, available, in_cart=0):
+        self.product_name = product_name
+        self.available = available
+        self.in_cart = in_cart
+        super().__init__(f'Only {available} units of {product_name} are available.')
+
+
+class StockShortage(Exception):
+    """Raised by bulk cart changes, listing every line that exceeds the stock"""
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__('; '.join(str(shortage) for shortage in shortages))
+
+
+def reservations_enabled():
+    return getattr(settings, 'CART_STOCK_RESERVATIONS', False) and apps.is_installed('decor')
+
+
+class StockService:
+    """Resolves decor stock levels for many products with a single IN query"""
+
+    def key(self, product):
+        return f'cart:stock:{product}'
+
+    @property
+    def ttl(self):
+        # Short-lived caching is opt-in, stock changes outside this app
+        return getattr(settings, 'CART_STOCK_CACHE_TTL', 0)
+
+    def lookup(self, product_names):
+        """Return {product_name: (decor pk, stock_quantity)} for the names decor knows"""
+        names = set(product_names)
+        if not names or not apps.is_installed('decor'):
+            return {}
+        from decor.models import DecorItemsModel
+        ordering = DecorItemsModel._meta.ordering or ['pk']
+        found = {}
+        rows = DecorItemsModel.objects.filter(item_name__in=names).order_by(*ordering)
+        for item_name, pk, stock_quantity in rows.values_list('item_name', 'pk', 'stock_quantity'):
+            # Same item the old per-name .first() lookup returned
+            found.setdefault(item_name, (pk, stock_quantity))
+        return found
+
+    def product_ids(self, product_names):
+        """Return {product_name: decor pk} for the names decor knows"""
+        return {name: pk for name, (pk, stock_quantity) in self.lookup(product_names).items()}
+
+    def get_stock_levels(self, product_names, fresh=False):
+        """
+        Return {product_name: stock_quantity} for the given names.
+
+        Products without a decor item map to None. Nothing is returned when
+        the decor app is not installed. fresh=True skips the cache, for
+        checks that guard a write. Only for products that are not in a cart
+        yet (and session carts); cart lines use get_item_stock_levels(),
+        which joins on product_id.
+        """
+        names = set(product_names)
+        if not names or not apps.is_installed('decor'):
+            return {}
+
+        levels = {}
+        use_cache = self.ttl and not fresh
+        if use_cache:
+            cached = cache.get_many([self.key(name) for name in names])
+            for name in names:
+                if self.key(name) in cached:
+                    levels[name] = cached[self.key(name)]
+
+        missing = names - set(levels)
+        if missing:
+            try:
+                found = self.lookup(missing)
+            except Exception:
+                return levels
+
+            for name in missing:
+                levels[name] = found[name][1] if name in found else None
+            if self.ttl:
+                cache.set_many({self.key(name): levels[name] for name in missing}, self.ttl)
+
+        return levels
+
+    def get_item_stock_levels(self, items, fresh=False, cart=None):
+        """
+        get_stock_levels() for cart lines, keyed by product_name but looked up
+        by primary key. Lines without a product_id are not stock-limited (None).
+        With reservations, stock held by cart is counted as available to it.
+        """
+        items = list(items)
+        levels = {item.product_name: None for item in items}
+        ids = {item.product_id: item.product_name for item in items if item.product_id is not None}
+        if not ids or not apps.is_installed('decor'):
+            return levels
+
+        stock = {}
+        use_cache = self.ttl and not fresh
+        if use_cache:
+            cached = cache.get_many([self.key(f'id:{pk}') for pk in ids])
+            stock = {pk: cached[self.key(f'id:{pk}')] for pk in ids if self.key(f'id:{pk}') in cached}
+
+        missing = set(ids) - set(stock)
+        if missing:
+            try:
+                from decor.models import DecorItemsModel
+                found = dict(DecorItemsModel.objects.filter(pk__in=missing).values_list('pk', 'stock_quantity'))
+            except Exception:
+                found = {}
+            for pk in missing:
+                stock[pk] = found.get(pk)
+            if self.ttl:
+                cache.set_many({self.key(f'id:{pk}'): stock[pk] for pk in missing}, self.ttl)
+
+        held = self.held(cart, ids) if cart is not None else {}
+        for pk, name in ids.items():
+            levels[name] = stock[pk] + held.get(pk, 0) if stock[pk] is not None else None
+        return levels
+
+    def held(self, cart, product_ids):
+        """Return {decor pk: units cart holds} (with reservations), to count as available to it"""
+        if not reservations_enabled():
+            return {}
+        held = StockReservation.objects.filter(cart=cart, product_id__in=list(product_ids))
+        return dict(held.values_list('product_id', 'quantity'))
+
+    def get_stock(self, product_name, fresh=False):
+        """Stock for one product, None if unknown"""
+        return self.get_stock_levels([product_name], fresh=fresh).get(product_name)
+
+    def get_product_stock(self, product_id):
+        """Current stock of the decor item product_id, None if unknown"""
+        if product_id is None or not apps.is_installed('decor'):
+            return None
+        return self.stock_rows(product_id).values_list('stock_quantity', flat=True).first()
+
+    def stock_rows(self, product_id):
+        """Queryset of the decor row holding the stock for product_id"""
+        from decor.models import DecorItemsModel
+        return DecorItemsModel.objects.filter(pk=product_id)
+
+    def lock_stock(self, product_ids):
+        """
+        Return {decor pk: stock_quantity}, locking the rows (SELECT ... FOR UPDATE)
+        so the stock cannot change before the caller's transaction commits.
+        """
+        ids = {pk for pk in product_ids if pk is not None}
+        if not ids or not apps.is_installed('decor'):
+            return {}
+        from decor.models import DecorItemsModel
+        # Locked in pk order so concurrent batches cannot deadlock each other
+        rows = DecorItemsModel.objects.select_for_update().filter(pk__in=ids).order_by('pk')
+        return dict(rows.values_list('pk', 'stock_quantity'))
+
+    def fits_stock(self, quantity):
+        """
+        Filter for CartItem rows whose new quantity (an expression) fits the decor
+        stock, evaluated inside the UPDATE so no other writer can slip in between.
+        """
+        if not apps.is_installed('decor'):
+            return Q()
+        from decor.models import DecorItemsModel
+        items = DecorItemsModel.objects.filter(pk=OuterRef('product_id'))
+        stock = Subquery(items.values('stock_quantity')[:1])
+        # Products unknown to the decor app are not stock-limited
+        return Q(product_id__isnull=True) | ~Exists(items) | Q(GreaterThanOrEqual(stock, quantity))
+
+
+stock_service = StockService()
+
+
+class ReservationService:
+    """
+    TTL'd stock holds, enabled with CART_STOCK_RESERVATIONS.
+
+    A hold takes units out of the decor stock with a conditional UPDATE
+    (WHERE stock_quantity >= n) and gives them back when the line shrinks, is
+    removed, or the hold expires and is swept. Cart.clear(), which empties
+    the cart once the order is placed, calls consume() so paid holds are not
+    handed back to the stock; clearing a cart without ordering must release()
+    first.
+    """
+
+    @property
+    def ttl(self):
+        return timedelta(seconds=getattr(settings, 'CART_RESERVATION_TTL', 900))
+
+    def hold(self, cart, product_name, quantity, product_id):
+        """Make the cart's hold on the decor item product_id (named product_name) exactly quantity units"""
+        if product_id is None:
+            return  # Not a decor product, nothing to hold
+        reservation = StockReservation.objects.select_for_update().filter(
+            cart=cart, product_id=product_id
+        ).first()
+        held = reservation.quantity if reservation else 0
+        delta = quantity - held
+        rows = stock_service.stock_rows(product_id)
+
+        if delta > 0:
+            taken = rows.filter(stock_quantity__gte=delta).update(stock_quantity=F('stock_quantity') - delta)
+            if not taken:
+                available = rows.values_list('stock_quantity', flat=True).first()
+                if available is None:
+                    return  # The decor item is gone, nothing to hold
+                raise InsufficientStock(product_name, available + held, in_cart=held)
+        elif delta < 0:
+            rows.update(stock_quantity=F('stock_quantity') - delta)
+
+        if quantity <= 0:
+            if reservation:
+                reservation.delete()
+        elif reservation:
+            reservation.quantity = quantity
+            reservation.expires_at = timezone.now() + self.ttl
+            reservation.save(update_fields=['quantity', 'expires_at'])
+        else:
+            StockReservation.objects.create(
+                cart=cart,
+                product_name=product_name,
+                product_id=product_id,
+                quantity=quantity,
+                expires_at=timezone.now() + self.ttl
+            )
+
+    def release(self, cart, product_id=None):
+        """Give the cart's holds (or the one on the decor item product_id) back to the stock"""
+        reservations = StockReservation.objects.select_for_update().filter(cart=cart)
+        if product_id is not None:
+            reservations = reservations.filter(product_id=product_id)
+        self._give_back(list(reservations))
+
+    def release_carts(self, cart_ids):
+        """Give back every hold of several carts at once"""
+        self._give_back(list(StockReservation.objects.select_for_update().filter(cart_id__in=cart_ids)))
+
+    def consume(self, cart):
+        """Drop the cart's holds without restoring stock, once the order is paid"""
+        StockReservation.objects.filter(cart=cart).delete()
+
+    def release_expired(self, batch_size=500):
+        """Sweep expired holds in small transactions, returning how many were released"""
+        released = 0
+        while True:
+            with transaction.atomic():
+                batch = list(
+                    StockReservation.objects.select_for_update(skip_locked=True)
+                    .filter(expires_at__lt=timezone.now())
+                    .order_by('expires_at')[:batch_size]
+                )
+                if not batch:
+                    return released
+                self._give_back(batch)
+            released += len(batch)
+
+    def _give_back(self, reservations):
+        totals = defaultdict(int)
+        for reservation in reservations:
+            totals[reservation.product_id] += reservation.quantity
+        for product_id, quantity in totals.items():
+            stock_service.stock_rows(product_id).update(stock_quantity=F('stock_quantity') + quantity)
+        StockReservation.objects.filter(pk__in=[reservation.pk for reservation in reservations]).delete()
+
+
+reservation_service = ReservationService()
+
+
+def line_key(product_id, product_name):
+    """What identifies a cart line: the decor pk, or the name for products decor does not know"""
+    return product_id if product_id is not None else product_name
+
+
+def line_lookup(product_id, product_name):
+    """CartItem filter for the line line_key() identifies"""
+    if product_id is not None:
+        return {'product_id': product_id}
+    return {'product_id__isnull': True, 'product_name': product_name}
+
+
+def add_item(cart, product_name, price, image, quantity):
+    """
+    Add quantity units of a product to a cart locked by the caller's transaction.
+
+    Returns (cart_item, created) or raises InsufficientStock, in which case the
+    caller's transaction must roll back.
+    """
+    product_id = stock_service.product_ids([product_name]).get(product_name)
+    # Decor products are matched on their pk, so a renamed product still finds its line
+    cart_item = CartItem.objects.filter(cart=cart, **line_lookup(product_id, product_name)).first()
+    created = cart_item is None
+    if created:
+        cart_item = CartItem.objects.create(
+            cart=cart,
+            product_name=product_name,
+            product_id=product_id,
+            product_price=price,
+            product_image=image,
+            quantity=0
+        )
+    in_cart = cart_item.quantity
+
+    items = CartItem.objects.filter(pk=cart_item.pk)
+    if reservations_enabled():
+        reservation_service.hold(cart, cart_item.product_name, in_cart + quantity, product_id)
+    else:
+        items = items.filter(stock_service.fits_stock(F('quantity') + quantity))
+
+    updated = items.update(
+        quantity=F('quantity') + quantity,
+        product_price=price,  # Update price in case it changed
+        product_image=image,
+        updated_at=timezone.now()
+    )
+    if not updated:
+        raise InsufficientStock(product_name, stock_service.get_product_stock(product_id), in_cart)
+
+    cart_item.refresh_from_db(fields=['quantity', 'product_price', 'product_image', 'updated_at'])
+    return cart_item, created
+
+
+def set_item_quantity(cart, cart_item, quantity):
+    """Set a line's quantity atomically, raising InsufficientStock if it does not fit"""
+    items = CartItem.objects.filter(pk=cart_item.pk)
+    if reservations_enabled():
+        reservation_service.hold(cart, cart_item.product_name, quantity, cart_item.product_id)
+    else:
+        items = items.filter(stock_service.fits_stock(Value(quantity)))
+
+    if not items.update(quantity=quantity, updated_at=timezone.now()):
+        available = stock_service.get_product_stock(cart_item.product_id)
+        raise InsufficientStock(cart_item.product_name, available, cart_item.quantity)
+    cart_item.quantity = quantity
+
+
+def remove_item(cart, cart_item):
+    """Delete a line and give back any stock it held"""
+    if reservations_enabled() and cart_item.product_id is not None:
+        reservation_service.release(cart, cart_item.product_id)
+    cart_item.delete()
+
+
+def apply_operations(cart, operations):
+    """
+    Apply add/set/remove operations to a cart locked by the caller's transaction.
+
+    Each operation is a dict with 'op' ('add', 'set' or 'remove'), either
+    'item_id' or 'product_name', and 'quantity', 'product_price' and
+    'product_image' where relevant. The final state is validated against the
+    stock with one query and written with bulk_create/bulk_update. Raises
+    StockShortage (nothing should be committed) or ValueError for an
+    operation on a line that is not in the cart or a line past
+    MAX_QUANTITY. The decor rows of growing lines stay locked until the
+    caller's transaction ends, so the stock checked is the stock the write
+    is made against.
+    """
+    existing = {line_key(item.product_id, item.product_name): item for item in cart.items.all()}
+    keys_by_id = {item.id: key for key, item in existing.items()}
+    keys_by_name = {item.product_name: key for key, item in existing.items()}
+    names = {key: item.product_name for key, item in existing.items()}
+    product_ids = {key: item.product_id for key, item in existing.items()}
+    lines = {
+        key: {'quantity': item.quantity, 'product_price': item.product_price, 'product_image': item.product_image}
+        for key, item in existing.items()
+    }
+    # Decor pk and stock of the products added, in one query (decor lines already know theirs)
+    known = {item.product_name: item.product_id for item in existing.values() if item.product_id is not None}
+    found = stock_service.lookup(
+        operation['product_name'] for operation in operations
+        if operation['op'] == 'add' and operation['product_name'] not in known
+    )
+
+    for position, operation in enumerate(operations):
+        name = operation.get('product_name')
+        if 'item_id' in operation:
+            key = keys_by_id.get(operation['item_id'])
+        elif operation['op'] == 'add':
+            # A renamed product still lands on its existing line
+            product_id = known[name] if name in known else found.get(name, (None, None))[0]
+            key = line_key(product_id, name)
+            names.setdefault(key, name)
+            product_ids.setdefault(key, product_id)
+        else:
+            key = keys_by_name.get(name)
+        if operation['op'] == 'add':
+            line = lines.setdefault(key, {'quantity': 0, 'product_price': None, 'product_image': ''})
+            line['quantity'] += operation['quantity']
+            line['product_price'] = operation['product_price']  # Update price in case it changed
+            line['product_image'] = operation.get('product_image', line['product_image'])
+        elif key not in lines:
+            raise ValueError(f'Operation {position}: item is not in the cart')
+        elif operation['op'] == 'set':
+            lines[key]['quantity'] = max(operation['quantity'], 0)
+        else:
+            lines[key]['quantity'] = 0
+
+    for key, line in lines.items():
+        if line['quantity'] > MAX_QUANTITY:
+            raise ValueError(f'{names[key]}: quantity must be at most {MAX_QUANTITY}')
+
+    def in_cart(key):
+        return existing[key].quantity if key in existing else 0
+
+    # Only lines that grow are checked, shrinking an over-stock line is always allowed
+    growing = [key for key, line in lines.items() if line['quantity'] > in_cart(key)]
+    if reservations_enabled():
+        shortages = []
+        for key, line in lines.items():
+            try:
+                with transaction.atomic():
+                    reservation_service.hold(cart, names[key], line['quantity'], product_ids[key])
+            except InsufficientStock as e:
+                shortages.append(e)
+    else:
+        stock_levels = stock_service.lock_stock(product_ids[key] for key in growing)
+        shortages = [
+            InsufficientStock(names[key], stock_levels[product_ids[key]], in_cart(key))
+            for key in growing
+            if product_ids[key] in stock_levels and stock_levels[product_ids[key]] < lines[key]['quantity']
+        ]
+    if shortages:
+        raise StockShortage(shortages)
+
+    now = timezone.now()
+    to_create, to_update, to_delete = [], [], []
+    for key, line in lines.items():
+        item = existing.get(key)
+        if line['quantity'] <= 0:
+            if item:
+                to_delete.append(item.pk)
+        elif item is None:
+            to_create.append(CartItem(cart=cart, product_name=names[key], product_id=product_ids[key], **line))
+        elif any(getattr(item, field) != value for field, value in line.items()):
+            for field, value in line.items():
+                setattr(item, field, value)
+            item.updated_at = now
+            to_update.append(item)
+
+    if to_delete:
+        CartItem.objects.filter(pk__in=to_delete).delete()
+    if to_update:
+        CartItem.objects.bulk_update(to_update, ['quantity', 'product_price', 'product_image', 'updated_at'])
+    if to_create:
+        CartItem.objects.bulk_create(to_create)
+
+
+def purge_abandoned_carts(idle_for, batch_size=500, archive=None, dry_run=False, progress=None):
+    """
+    Delete carts untouched for idle_for (a timedelta) in small transactions.
+
+    Carts are walked in (updated_at, id) order with a keyset cursor, so each
+    batch is a short range scan and never revisits rows; carts locked by a
+    live request are skipped. If archive is a writable text file, each cart
+    and its lines are written to it as one JSON line before deletion.
+    progress(carts, items) is called after every batch with the running
+    totals. Returns (carts, items).
+    """
+    cutoff = timezone.now() - idle_for
+    carts_done = items_done = 0
+    last = None
+
+    while True:
+        with transaction.atomic():
+            carts = Cart.objects.filter(updated_at__lt=cutoff)
+            if last is not None:
+                carts = carts.filter(Q(updated_at__gt=last[0]) | Q(updated_at=last[0], pk__gt=last[1]))
+            if not dry_run:
+                carts = carts.select_for_update(skip_locked=True)
+            batch = list(
+                carts.order_by('updated_at', 'pk').values('id', 'user_id', 'created_at', 'updated_at')[:batch_size]
+            )
+            if not batch:
+                return carts_done, items_done
+            last = (batch[-1]['updated_at'], batch[-1]['id'])
+            cart_ids = [cart['id'] for cart in batch]
+
+            items = CartItem.objects.filter(cart_id__in=cart_ids)
+            if archive is not None:
+                lines = defaultdict(list)
+                for item in items.values('cart_id', 'product_name', 'product_price', 'product_image', 'quantity'):
+                    lines[item.pop('cart_id')].append(item)
+                for cart in batch:
+                    archive.write(json.dumps({**cart, 'items': lines[cart['id']]}, cls=DjangoJSONEncoder) + '\n')
+
+            if dry_run:
+                items_done += items.count()
+            else:
+                if reservations_enabled():
+                    reservation_service.release_carts(cart_ids)
+                items_deleted, _ = items.delete()
+                items_done += items_deleted
+                Cart.objects.filter(pk__in=cart_ids).delete()
+                user_keys = [cart_summary_key(cart['user_id']) for cart in batch]
+                transaction.on_commit(lambda keys=user_keys: cache.delete_many(keys))
+
+        carts_done += len(batch)
+        if progress is not None:
+            progress(carts_done, items_done)
@@ -0,0 +1,9 @@
+from django.contrib.auth.signals import user_logged_in
+from django.dispatch import receiver
+from .guest import merge_guest_cart
+
+@receiver(user_logged_in)
+def merge_guest_cart_on_login(sender, request, user, **kwargs):
+    """Move the anonymous session cart into the user's cart"""
+    if request is not None and hasattr(request, 'session'):
+        merge_guest_cart(request, user)
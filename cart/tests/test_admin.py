@@ -0,0 +1,54 @@
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from cart.models import Cart, CartItem
+
+
+class ChangelistQueryTests(TestCase):
+    """The changelists must cost the same number of queries for one row as for a full page"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        self.client.force_login(self.admin_user)
+
+    def add_carts(self, count):
+        start = Cart.objects.count()
+        for number in range(start, start + count):
+            cart = Cart.objects.create(user=User.objects.create_user(f'shopper-{number}'))
+            CartItem.objects.create(cart=cart, product_name='Lamp', product_price='10.00', quantity=2)
+            CartItem.objects.create(cart=cart, product_name='Vase', product_price='5.00', quantity=1)
+            cart.refresh_totals()
+
+    def page_size(self, model):
+        return admin.site._registry[model].list_per_page
+
+    def assertChangelistQueries(self, url_name, num, full_page=False):
+        with self.assertNumQueries(num):
+            response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200)
+        if full_page:
+            changelist = response.context['cl']
+            self.assertEqual(len(changelist.result_list), changelist.list_per_page)
+
+    def test_cart_changelist(self):
+        self.add_carts(1)
+        self.assertChangelistQueries('admin:cart_cart_changelist', 5)
+        self.add_carts(self.page_size(Cart) - 1)
+        self.assertChangelistQueries('admin:cart_cart_changelist', 5, full_page=True)
+
+    @override_settings(CART_DENORMALIZED_TOTALS=True)
+    def test_cart_changelist_with_denormalized_totals(self):
+        self.add_carts(1)
+        self.assertChangelistQueries('admin:cart_cart_changelist', 5)
+        self.add_carts(self.page_size(Cart) - 1)
+        self.assertChangelistQueries('admin:cart_cart_changelist', 5, full_page=True)
+
+    def test_cart_item_changelist(self):
+        self.add_carts(1)
+        self.assertChangelistQueries('admin:cart_cartitem_changelist', 6)
+        self.add_carts(self.page_size(CartItem) - 1)
+        self.assertChangelistQueries('admin:cart_cartitem_changelist', 6, full_page=True)
@@ -0,0 +1,77 @@
+from unittest import mock, skipUnless
+from django.apps import apps
+from django.contrib.auth import login
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+from cart.guest import GuestCart
+from cart.models import Cart, CartItem, StockReservation
+from cart.services import stock_service
+
+
+@skipUnless(apps.is_installed('decor'), 'stock is read from the decor app')
+class LoginMergeTests(TestCase):
+    """The session cart is folded into the user's cart on login, capped by the stock"""
+
+    def setUp(self):
+        from decor.models import DecorItemsModel
+        cache.clear()
+        self.lamp = DecorItemsModel.objects.create(item_name='Lamp', stock_quantity=5)
+        self.user = User.objects.create_user('shopper', password='password')
+        self.cart = Cart.objects.create(user=self.user)
+
+    def request_with_guest_cart(self, quantity):
+        request = RequestFactory().post('/accounts/login/')
+        SessionMiddleware(lambda request: None).process_request(request)
+        request._messages = FallbackStorage(request)
+        GuestCart(request.session).add('Lamp', '10.00', '', quantity)
+        return request
+
+    def add_line(self, quantity):
+        return CartItem.objects.create(
+            cart=self.cart, product_name='Lamp', product_id=self.lamp.pk, product_price='10.00', quantity=quantity
+        )
+
+    def set_stock(self, quantity):
+        type(self.lamp).objects.filter(pk=self.lamp.pk).update(stock_quantity=quantity)
+
+    def log_in(self, request):
+        login(request, self.user, backend='django.contrib.auth.backends.ModelBackend')
+        return [str(message) for message in get_messages(request)]
+
+    def test_merges_into_the_existing_line(self):
+        self.add_line(2)
+        request = self.request_with_guest_cart(1)
+        self.assertEqual(self.log_in(request), [])
+        self.assertEqual(CartItem.objects.get(cart=self.cart).quantity, 3)
+        self.assertEqual(GuestCart(request.session).get_items(), [])
+
+    def test_shrinks_the_line_to_the_stock(self):
+        self.add_line(2)
+        request = self.request_with_guest_cart(1)
+        self.set_stock(2)
+        self.assertEqual(self.log_in(request), ['Only 2 units of Lamp are available, your cart was updated.'])
+        self.assertEqual(CartItem.objects.get(cart=self.cart).quantity, 2)
+
+    def test_removes_an_existing_line_out_of_stock(self):
+        self.add_line(2)
+        request = self.request_with_guest_cart(1)
+        self.set_stock(0)
+        self.assertEqual(self.log_in(request), ['Lamp is out of stock and was removed from your cart.'])
+        self.assertFalse(CartItem.objects.filter(cart=self.cart).exists())
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.item_count, 0)
+
+    @override_settings(CART_STOCK_RESERVATIONS=True)
+    def test_removes_an_existing_line_the_hold_shrinks_to_zero(self):
+        self.add_line(2)
+        request = self.request_with_guest_cart(1)
+        self.set_stock(0)
+        # The stock looked up before holding is stale, the hold finds none left
+        with mock.patch.object(stock_service, 'lookup', return_value={'Lamp': (self.lamp.pk, 5)}):
+            self.assertEqual(self.log_in(request), ['Lamp is out of stock and was removed from your cart.'])
+        self.assertFalse(CartItem.objects.filter(cart=self.cart).exists())
+        self.assertFalse(StockReservation.objects.filter(cart=self.cart).exists())
@@ -0,0 +1,53 @@
+from unittest import skipUnless
+from django.apps import apps
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+BEFORE = [('cart', '0002_product_ids_totals_and_reservations')]
+AFTER = [('cart', '0003_backfill_cartitem_product_ids')]
+
+
+@skipUnless(apps.is_installed('decor'), 'lines are linked to the decor app')
+class BackfillProductIdsTests(TransactionTestCase):
+    """0003 links name-keyed lines to their decor item"""
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        # decor is not a dependency of cart, its models join the state explicitly
+        targets = targets + [node for node in executor.loader.graph.leaf_nodes() if node[0] == 'decor']
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def setUp(self):
+        old_apps = self.migrate(BEFORE)
+        User = old_apps.get_model('auth', 'User')
+        DecorItemsModel = old_apps.get_model('decor', 'DecorItemsModel')
+        Cart = old_apps.get_model('cart', 'Cart')
+        self.CartItem = old_apps.get_model('cart', 'CartItem')
+
+        self.lamp = DecorItemsModel.objects.create(item_name='Lamp', stock_quantity=5)
+        self.cart = Cart.objects.create(user=User.objects.create(username='shopper'))
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def add_line(self, product_name, quantity, product_id=None):
+        return self.CartItem.objects.create(
+            cart=self.cart, product_name=product_name, product_id=product_id, product_price='10.00', quantity=quantity
+        ).pk
+
+    def lines(self):
+        CartItem = self.migrate(AFTER).get_model('cart', 'CartItem')
+        return list(CartItem.objects.order_by('pk').values_list('product_name', 'product_id', 'quantity'))
+
+    def test_links_lines_by_name(self):
+        self.add_line('Lamp', 2)
+        self.add_line('Gift card', 1)
+        self.assertEqual(self.lines(), [('Lamp', self.lamp.pk, 2), ('Gift card', None, 1)])
+
+    def test_folds_a_line_into_the_one_already_linked(self):
+        self.add_line('Lamp', 2)
+        self.add_line('Desk lamp', 1, product_id=self.lamp.pk)
+        self.assertEqual(self.lines(), [('Desk lamp', self.lamp.pk, 3)])
@@ -0,0 +1,96 @@
+from datetime import timedelta
+from unittest import skipUnless
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from cart.models import Cart, CartItem, StockReservation
+from cart.services import InsufficientStock, add_item, purge_abandoned_carts, remove_item, set_item_quantity
+
+
+@skipUnless(apps.is_installed('decor'), 'stock is read from the decor app')
+class StockTests(TestCase):
+    """Cart changes against the decor stock, with and without reservations"""
+
+    def setUp(self):
+        from decor.models import DecorItemsModel
+        cache.clear()
+        self.lamp = DecorItemsModel.objects.create(item_name='Lamp', stock_quantity=5)
+        self.cart = Cart.objects.create(user=User.objects.create_user('shopper'))
+
+    def add(self, quantity):
+        with transaction.atomic():
+            return add_item(self.cart, 'Lamp', '10.00', '', quantity)
+
+    def stock(self):
+        self.lamp.refresh_from_db()
+        return self.lamp.stock_quantity
+
+    def held(self):
+        return StockReservation.objects.filter(cart=self.cart).values_list('quantity', flat=True).first()
+
+    def test_add_is_capped_by_the_stock(self):
+        self.add(3)
+        with self.assertRaises(InsufficientStock) as raised:
+            self.add(3)
+        self.assertEqual(raised.exception.available, 5)
+        self.assertEqual(raised.exception.in_cart, 3)
+        self.assertEqual(CartItem.objects.get(cart=self.cart).quantity, 3)
+        # Without reservations the stock is only checked, never taken
+        self.assertEqual(self.stock(), 5)
+
+    @override_settings(CART_STOCK_RESERVATIONS=True)
+    def test_reservations_hold_and_release_stock(self):
+        item, created = self.add(3)
+        self.assertEqual((self.held(), self.stock()), (3, 2))
+
+        with self.assertRaises(InsufficientStock):
+            self.add(3)
+        self.assertEqual((self.held(), self.stock()), (3, 2))
+
+        with transaction.atomic():
+            set_item_quantity(self.cart, item, 1)
+        self.assertEqual((self.held(), self.stock()), (1, 4))
+
+        with transaction.atomic():
+            remove_item(self.cart, item)
+        self.assertEqual((self.held(), self.stock()), (None, 5))
+
+    @override_settings(CART_STOCK_RESERVATIONS=True)
+    def test_clear_consumes_holds(self):
+        self.add(3)
+        self.cart.clear()
+        self.assertFalse(CartItem.objects.filter(cart=self.cart).exists())
+        # The units left with the order, they are not handed back
+        self.assertEqual((self.held(), self.stock()), (None, 2))
+
+
+class PurgeAbandonedCartsTests(TestCase):
+    def add_cart(self, name, updated_at):
+        cart = Cart.objects.create(user=User.objects.create_user(name))
+        CartItem.objects.create(cart=cart, product_name='Vase', product_price='5.00', quantity=1)
+        Cart.objects.filter(pk=cart.pk).update(updated_at=updated_at)
+        return cart
+
+    def test_pages_through_every_idle_cart(self):
+        now = timezone.now()
+        # Ties on updated_at must not be skipped or revisited between batches
+        idle = [self.add_cart(f'idle-{number}', now - timedelta(days=40 - number // 3)) for number in range(5)]
+        active = self.add_cart('active', now)
+        progress = []
+
+        carts, items = purge_abandoned_carts(
+            timedelta(days=30), batch_size=2, progress=lambda *totals: progress.append(totals)
+        )
+        self.assertEqual((carts, items), (5, 5))
+        self.assertEqual(progress, [(2, 2), (4, 4), (5, 5)])
+        self.assertFalse(Cart.objects.filter(pk__in=[cart.pk for cart in idle]).exists())
+        self.assertTrue(CartItem.objects.filter(cart=active).exists())
+
+    def test_dry_run_counts_without_deleting(self):
+        for number in range(3):
+            self.add_cart(f'idle-{number}', timezone.now() - timedelta(days=40))
+        self.assertEqual(purge_abandoned_carts(timedelta(days=30), batch_size=2, dry_run=True), (3, 3))
+        self.assertEqual(Cart.objects.count(), 3)
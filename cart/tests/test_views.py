@@ -0,0 +1,57 @@
+import json
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from cart.models import CartItem
+from cart.services import MAX_QUANTITY
+
+
+class BulkUpdateValidationTests(TestCase):
+    """Operations that don't fit the CartItem columns are rejected before anything is written"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('shopper')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def post(self, *operations):
+        return self.client.post(
+            reverse('cart:bulk_update'),
+            json.dumps({'operations': list(operations)}),
+            content_type='application/json',
+        )
+
+    def add(self, **fields):
+        return {'op': 'add', 'product_name': 'Lamp', 'product_price': '10.00', **fields}
+
+    def test_rejects_prices_the_column_cannot_hold(self):
+        for price in ('123456789012', '1e999999', '0.001', '-1', 'NaN', 'Infinity', 'ten'):
+            with self.subTest(price=price):
+                response = self.post(self.add(product_price=price))
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('product_price', response.json()['error'])
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_accepts_the_largest_price(self):
+        response = self.post(self.add(product_price='99999999.99'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(str(CartItem.objects.get().product_price), '99999999.99')
+
+    def test_rejects_quantities_past_the_column(self):
+        response = self.post(self.add(quantity=MAX_QUANTITY + 1))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('quantity', response.json()['error'])
+
+        response = self.post(self.add())
+        self.assertEqual(response.status_code, 200)
+        item_id = CartItem.objects.get().pk
+        response = self.post({'op': 'set', 'item_id': item_id, 'quantity': MAX_QUANTITY + 1})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(CartItem.objects.get().quantity, 1)
+
+    def test_rejects_adds_that_sum_past_the_column(self):
+        response = self.post(self.add(quantity=MAX_QUANTITY), self.add(quantity=1))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(CartItem.objects.exists())
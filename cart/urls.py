@@ -9,4 +9,6 @@ urlpatterns = [
     path('update/<int:item_id>/', views.update_cart, name='update'),
     path('remove/<int:item_id>/', views.remove_from_cart, name='remove'),
     path('clear/', views.clear_cart, name='clear'),
+    path('api/bulk/', views.bulk_update_cart, name='bulk_update'),
+    path('api/summary/', views.cart_summary, name='summary'),
 ]
\ No newline at end of file
@@ -1,21 +1,39 @@
+import json
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
-from django.views.decorators.http import require_POST
-from django.apps import apps
-from decimal import Decimal
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import condition, require_GET, require_POST
+from django import forms
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from .guest import GuestCart
 from .models import Cart, CartItem
+from .services import (
+    MAX_QUANTITY, InsufficientStock, StockShortage, add_item, apply_operations, remove_item, reservation_service,
+    reservations_enabled, set_item_quantity, stock_service,
+)
 
-@login_required
 def cart_detail(request):
     """Display cart contents page"""
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    items = cart.items.all()
-    
-    # Calculate totals
-    subtotal = cart.get_total_price()
-    total_items = cart.get_total_items()
+    if request.user.is_authenticated:
+        cart = Cart.objects.filter(user=request.user).first()
+        items = list(cart.items.all()) if cart else []
+        
+        # Calculate totals
+        total_items, subtotal = cart.get_totals() if cart else (0, Decimal('0.00'))
+        # Every cart change bumps updated_at, so it versions the cached fragments
+        cart_version = f'{cart.pk}:{cart.updated_at.timestamp()}' if cart else None
+        fragment_cache_ttl = getattr(settings, 'CART_FRAGMENT_CACHE_TTL', 300)
+    else:
+        # Anonymous visitors keep their cart in the session
+        cart = GuestCart(request.session)
+        items = cart.get_items()
+        total_items, subtotal = cart.get_totals()
+        # Session carts have no stable identity to key fragments on, so they are not cached
+        cart_version = None
+        fragment_cache_ttl = 0
     
     # Check for applied coupon in session
     applied_coupon = request.session.get('applied_coupon', None)
@@ -32,43 +50,43 @@ def cart_detail(request):
     stock_warnings = []
     can_checkout = True
     
-    # Enhance items with stock information if decor app is available
-    enhanced_items = []
+    # Stock for every item in one query (empty if the decor app is not installed)
+    if request.user.is_authenticated:
+        stock_levels = stock_service.get_item_stock_levels(items, cart=cart)
+    else:
+        stock_levels = stock_service.get_stock_levels(item.product_name for item in items)
+    
+    # One view-model per line, in cart order, so the template never searches
+    lines = []
     for item in items:
-        item_data = {
+        line = {
             'item': item,
-            'stock_info': None
+            'line_total': item.get_total_price(),
+            'stock_info': None,
+            'warning': None
         }
         
-        # Try to get stock info from decor app
-        if apps.is_installed('decor'):
-            try:
-                from decor.models import DecorItemsModel
-                decor_item = DecorItemsModel.objects.filter(
-                    item_name=item.product_name
-                ).first()
-                
-                if decor_item:
-                    available_stock = decor_item.stock_quantity
-                    item_data['stock_info'] = {
-                        'available': available_stock,
-                        'status': 'in_stock' if available_stock >= item.quantity else 'out_of_stock'
-                    }
-                    
-                    if available_stock < item.quantity:
-                        stock_warnings.append(f"{item.product_name}: Only {available_stock} available, you have {item.quantity} in cart")
-                        can_checkout = False
-                    elif available_stock < 10:
-                        item_data['stock_info']['status'] = 'low_stock'
-            except:
-                pass
+        available_stock = stock_levels.get(item.product_name)
+        if available_stock is not None:
+            line['stock_info'] = {
+                'available': available_stock,
+                'status': 'in_stock' if available_stock >= item.quantity else 'out_of_stock'
+            }
+            
+            if available_stock < item.quantity:
+                line['warning'] = f"{item.product_name}: Only {available_stock} available, you have {item.quantity} in cart"
+                stock_warnings.append(line['warning'])
+                can_checkout = False
+            elif available_stock < 10:
+                line['stock_info']['status'] = 'low_stock'
         
-        enhanced_items.append(item_data)
+        lines.append(line)
     
     context = {
         'cart': cart,
-        'items': items,
-        'enhanced_items': enhanced_items,
+        'lines': lines,
+        'cart_version': cart_version,
+        'fragment_cache_ttl': fragment_cache_ttl,
         'subtotal': subtotal,
         'total_items': total_items,
         'discount_amount': discount_amount,
@@ -80,7 +98,6 @@ def cart_detail(request):
     
     return render(request, 'cart/cart_detail.html', context)
 
-@login_required
 @require_POST
 def add_to_cart(request):
     """Add products to cart via POST request"""
@@ -104,162 +121,366 @@ def add_to_cart(request):
         messages.error(request, 'Invalid price or quantity.')
         return redirect(request.META.get('HTTP_REFERER', 'decor:home'))
     
-    # Check stock availability if decor app is installed
-    if apps.is_installed('decor'):
-        try:
-            from decor.models import DecorItemsModel
-            decor_item = DecorItemsModel.objects.filter(item_name=product_name).first()
-            if decor_item and decor_item.stock_quantity < qty:
-                messages.error(request, f'Only {decor_item.stock_quantity} units of {product_name} are available.')
-                return redirect(request.META.get('HTTP_REFERER', 'decor:home'))
-        except:
-            pass
+    try:
+        if request.user.is_authenticated:
+            with transaction.atomic():
+                # Get or create user's cart, locking it so concurrent changes keep the totals right
+                cart, created = Cart.objects.select_for_update().get_or_create(user=request.user)
+                
+                # Add or update cart item, the stock check happens inside the UPDATE
+                cart_item, item_created = add_item(cart, product_name, price, product_image, qty)
+                cart.refresh_totals()
+            cart_count = cart.item_count
+        else:
+            # No database rows for guests until they log in
+            guest_cart = GuestCart(request.session)
+            cart_item, item_created = guest_cart.add(product_name, price, product_image, qty)
+            cart_count = guest_cart.get_totals()[0]
+    except InsufficientStock as e:
+        if e.in_cart:
+            messages.error(request, f'Cannot add more. Only {e.available} units available.')
+        else:
+            messages.error(request, f'Only {e.available} units of {product_name} are available.')
+        return redirect(request.META.get('HTTP_REFERER', 'decor:home'))
     
-    # Get or create user's cart
-    cart, created = Cart.objects.get_or_create(user=request.user)
+    if item_created:
+        messages.success(request, f'Added {product_name} to your cart.')
+    else:
+        messages.success(request, f'Updated {product_name} quantity in your cart.')
     
-    # Add or update cart item
-    cart_item, item_created = CartItem.objects.get_or_create(
-        cart=cart,
-        product_name=product_name,
-        defaults={
-            'product_price': price,
-            'product_image': product_image,
-            'quantity': qty
-        }
-    )
+    # Return JSON response for AJAX requests
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return JsonResponse({
+            'success': True,
+            'message': f'Added {product_name} to cart',
+            'cart_count': cart_count
+        })
     
-    if not item_created:
-        # Item already exists, update quantity
-        new_quantity = cart_item.quantity + qty
-        
-        # Check total quantity against stock
-        if apps.is_installed('decor'):
-            try:
-                from decor.models import DecorItemsModel
-                decor_item = DecorItemsModel.objects.filter(item_name=product_name).first()
-                if decor_item and decor_item.stock_quantity < new_quantity:
-                    messages.error(request, f'Cannot add more. Only {decor_item.stock_quantity} units available.')
-                    return redirect(request.META.get('HTTP_REFERER', 'decor:home'))
-            except:
-                pass
-        
-        cart_item.quantity = new_quantity
-        cart_item.product_price = price  # Update price in case it changed
-        cart_item.product_image = product_image
-        cart_item.save()
-        messages.success(request, f'Updated {product_name} quantity in your cart.')
+    return redirect('cart:detail')
+
+def guest_update_cart(request, item_id):
+    """update_cart for a session cart"""
+    guest_cart = GuestCart(request.session)
+    if guest_cart.get_item(item_id) is None:
+        raise Http404('No such cart item')
+    
+    try:
+        qty = int(request.POST.get('quantity', '1'))
+        cart_item = guest_cart.set_quantity(item_id, qty)
+    except ValueError:
+        messages.error(request, 'Invalid quantity.')
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return JsonResponse({
+                'success': False,
+                'error': 'Invalid quantity'
+            })
+        return redirect('cart:detail')
+    except InsufficientStock as e:
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return JsonResponse({
+                'success': False,
+                'error': f'Only {e.available} units available'
+            })
+        messages.error(request, f'Only {e.available} units available.')
+        return redirect('cart:detail')
+    
+    cart_count, subtotal = guest_cart.get_totals()
+    if qty <= 0:
+        messages.success(request, f'Removed {cart_item.product_name} from your cart.')
     else:
-        messages.success(request, f'Added {product_name} to your cart.')
+        messages.success(request, f'Updated {cart_item.product_name} quantity.')
     
     # Return JSON response for AJAX requests
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        if qty <= 0:
+            return JsonResponse({
+                'success': True,
+                'removed': True,
+                'message': f'Removed {cart_item.product_name}',
+                'cart_subtotal': str(subtotal),
+                'cart_count': cart_count
+            })
         return JsonResponse({
             'success': True,
-            'message': f'Added {product_name} to cart',
-            'cart_count': cart.get_total_items()
+            'item_total': str(cart_item.get_total_price()),
+            'cart_subtotal': str(subtotal),
+            'cart_count': cart_count
         })
     
     return redirect('cart:detail')
 
-@login_required
 @require_POST
 def update_cart(request, item_id):
     """Modify quantity of existing cart items"""
-    cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
+    if not request.user.is_authenticated:
+        return guest_update_cart(request, item_id)
     
     quantity = request.POST.get('quantity', '1')
     
-    try:
-        qty = int(quantity)
-        if qty <= 0:
-            cart_item.delete()
-            messages.success(request, f'Removed {cart_item.product_name} from your cart.')
-            
-            # Return JSON response for AJAX requests
+    with transaction.atomic():
+        # Lock the cart so concurrent changes keep the totals right
+        cart = get_object_or_404(Cart.objects.select_for_update(), user=request.user)
+        cart_item = get_object_or_404(CartItem, id=item_id, cart=cart)
+        
+        try:
+            qty = int(quantity)
+            if qty <= 0:
+                remove_item(cart, cart_item)
+                cart.refresh_totals()
+                messages.success(request, f'Removed {cart_item.product_name} from your cart.')
+                
+                # Return JSON response for AJAX requests
+                if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                    return JsonResponse({
+                        'success': True,
+                        'removed': True,
+                        'message': f'Removed {cart_item.product_name}',
+                        'cart_subtotal': str(cart.subtotal),
+                        'cart_count': cart.item_count
+                    })
+            else:
+                # The stock check happens inside the UPDATE
+                try:
+                    with transaction.atomic():
+                        set_item_quantity(cart, cart_item, qty)
+                except InsufficientStock as e:
+                    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                        return JsonResponse({
+                            'success': False,
+                            'error': f'Only {e.available} units available'
+                        })
+                    else:
+                        messages.error(request, f'Only {e.available} units available.')
+                        return redirect('cart:detail')
+                
+                cart.refresh_totals()
+                messages.success(request, f'Updated {cart_item.product_name} quantity.')
+        except ValueError:
+            messages.error(request, 'Invalid quantity.')
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-                cart = Cart.objects.get(user=request.user)
                 return JsonResponse({
-                    'success': True,
-                    'removed': True,
-                    'message': f'Removed {cart_item.product_name}',
-                    'cart_subtotal': str(cart.get_total_price()),
-                    'cart_count': cart.get_total_items()
+                    'success': False,
+                    'error': 'Invalid quantity'
                 })
-        else:
-            # Check stock availability if decor app is installed
-            if apps.is_installed('decor'):
-                try:
-                    from decor.models import DecorItemsModel
-                    decor_item = DecorItemsModel.objects.filter(
-                        item_name=cart_item.product_name
-                    ).first()
-                    if decor_item and decor_item.stock_quantity < qty:
-                        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-                            return JsonResponse({
-                                'success': False,
-                                'error': f'Only {decor_item.stock_quantity} units available'
-                            })
-                        else:
-                            messages.error(request, f'Only {decor_item.stock_quantity} units available.')
-                            return redirect('cart:detail')
-                except:
-                    pass
-            
-            cart_item.quantity = qty
-            cart_item.save()
-            messages.success(request, f'Updated {cart_item.product_name} quantity.')
-    except ValueError:
-        messages.error(request, 'Invalid quantity.')
-        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            return JsonResponse({
-                'success': False,
-                'error': 'Invalid quantity'
-            })
     
     # Return JSON response for AJAX requests
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        cart = cart_item.cart
         return JsonResponse({
             'success': True,
             'item_total': str(cart_item.get_total_price()),
-            'cart_subtotal': str(cart.get_total_price()),
-            'cart_count': cart.get_total_items()
+            'cart_subtotal': str(cart.subtotal),
+            'cart_count': cart.item_count
         })
     
     return redirect('cart:detail')
 
-@login_required
 @require_POST
 def remove_from_cart(request, item_id):
     """Delete specific item from cart"""
-    cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-    product_name = cart_item.product_name
-    cart_item.delete()
+    if request.user.is_authenticated:
+        with transaction.atomic():
+            # Lock the cart so concurrent changes keep the totals right
+            cart = get_object_or_404(Cart.objects.select_for_update(), user=request.user)
+            cart_item = get_object_or_404(CartItem, id=item_id, cart=cart)
+            product_name = cart_item.product_name
+            remove_item(cart, cart_item)
+            cart.refresh_totals()
+        cart_count, subtotal = cart.item_count, cart.subtotal
+    else:
+        guest_cart = GuestCart(request.session)
+        cart_item = guest_cart.remove(item_id)
+        if cart_item is None:
+            raise Http404('No such cart item')
+        product_name = cart_item.product_name
+        cart_count, subtotal = guest_cart.get_totals()
     
     messages.success(request, f'Removed {product_name} from your cart.')
     
     # Return JSON response for AJAX requests
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        cart = Cart.objects.get(user=request.user)
         return JsonResponse({
             'success': True,
             'message': f'Removed {product_name}',
-            'cart_subtotal': str(cart.get_total_price()),
-            'cart_count': cart.get_total_items()
+            'cart_subtotal': str(subtotal),
+            'cart_count': cart_count
         })
     
     return redirect('cart:detail')
 
-@login_required
 @require_POST
 def clear_cart(request):
     """Empty entire cart"""
+    if not request.user.is_authenticated:
+        GuestCart(request.session).clear()
+        messages.success(request, 'Your cart has been cleared.')
+        return redirect('cart:detail')
+    
     try:
-        cart = Cart.objects.get(user=request.user)
-        cart.clear()
+        with transaction.atomic():
+            cart = Cart.objects.select_for_update().get(user=request.user)
+            if reservations_enabled():
+                reservation_service.release(cart)
+            cart.clear()
         messages.success(request, 'Your cart has been cleared.')
     except Cart.DoesNotExist:
         messages.info(request, 'Your cart is already empty.')
     
-    return redirect('cart:detail')
\ No newline at end of file
+    return redirect('cart:detail')
+
+PRICE_FIELD = forms.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+
+def parse_quantity(value, minimum=0):
+    """Parse a quantity, raising ValueError when it doesn't fit CartItem.quantity"""
+    quantity = int(value)
+    if quantity > MAX_QUANTITY:
+        raise ValueError(f'quantity must be at most {MAX_QUANTITY}')
+    return max(quantity, minimum)
+
+def parse_operation(data):
+    """Validate one bulk operation, returning it normalized or raising ValueError"""
+    if not isinstance(data, dict) or data.get('op') not in ('add', 'set', 'remove'):
+        raise ValueError("'op' must be one of add, set, remove")
+    operation = {'op': data['op']}
+
+    if data['op'] == 'add':
+        if not data.get('product_name') or data.get('product_price') in (None, ''):
+            raise ValueError('add needs product_name and product_price')
+        operation['product_name'] = str(data['product_name'])
+        try:
+            # Same bounds as CartItem.product_price, so nothing is stored that the column can't hold
+            operation['product_price'] = PRICE_FIELD.clean(str(data['product_price']))
+        except ValidationError as e:
+            raise ValueError(f"product_price: {' '.join(e.messages)}")
+        operation['product_image'] = str(data.get('product_image', ''))
+        operation['quantity'] = parse_quantity(data.get('quantity', 1), minimum=1)
+        return operation
+
+    if 'item_id' in data:
+        operation['item_id'] = int(data['item_id'])
+    elif data.get('product_name'):
+        operation['product_name'] = str(data['product_name'])
+    else:
+        raise ValueError(f"{data['op']} needs item_id or product_name")
+    if data['op'] == 'set':
+        operation['quantity'] = parse_quantity(data['quantity'])
+    return operation
+
+def cart_state(cart):
+    """Serializable snapshot of the cart after a change"""
+    items = [
+        {
+            'id': item.id,
+            'product_name': item.product_name,
+            'product_price': str(item.product_price),
+            'product_image': item.product_image,
+            'quantity': item.quantity,
+            'item_total': str(item.get_total_price()),
+        }
+        for item in cart.items.all()
+    ]
+    return {
+        'items': items,
+        'cart_count': cart.item_count,
+        'cart_subtotal': str(cart.subtotal),
+    }
+
+@login_required
+@require_POST
+def bulk_update_cart(request):
+    """Apply a list of add/set/remove operations in one transaction"""
+    try:
+        data = json.loads(request.body)
+        raw_operations = data.get('operations')
+        if not isinstance(raw_operations, list) or not raw_operations:
+            raise ValueError('operations must be a non-empty list')
+        max_operations = getattr(settings, 'CART_BULK_MAX_OPERATIONS', 100)
+        if len(raw_operations) > max_operations:
+            raise ValueError(f'At most {max_operations} operations can be sent at once')
+        operations = [parse_operation(operation) for operation in raw_operations]
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+    except (ValueError, TypeError, KeyError) as e:
+        return JsonResponse({'success': False, 'error': f'Invalid operation: {e}'}, status=400)
+
+    try:
+        with transaction.atomic():
+            cart, created = Cart.objects.select_for_update().get_or_create(user=request.user)
+            apply_operations(cart, operations)
+            cart.refresh_totals()
+    except StockShortage as e:
+        return JsonResponse({
+            'success': False,
+            'error': 'Not enough stock',
+            'shortages': [
+                {'product_name': shortage.product_name, 'available': shortage.available}
+                for shortage in e.shortages
+            ]
+        }, status=409)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    return JsonResponse({'success': True, **cart_state(cart)})
+
+def cart_last_modified(request):
+    """updated_at of the user's cart, looked up once per request (None without a cart)"""
+    if not request.user.is_authenticated:
+        return None
+    if not hasattr(request, '_cart_updated_at'):
+        request._cart_updated_at = Cart.objects.filter(
+            user=request.user
+        ).values_list('updated_at', flat=True).first()
+    return request._cart_updated_at
+
+def cart_etag(request):
+    """Every cart change bumps updated_at, so it versions the summary"""
+    if not request.user.is_authenticated:
+        # Session carts carry their own change counter
+        return f'guest-{GuestCart(request.session).version}'
+    updated_at = cart_last_modified(request)
+    version = updated_at.timestamp() if updated_at else 'empty'
+    return f'cart-{request.user.pk}-{version}'
+
+@require_GET
+@condition(etag_func=cart_etag, last_modified_func=cart_last_modified)
+def cart_summary(request):
+    """Read-only cart count, subtotal and lines; unchanged carts answer 304 after one lookup"""
+    if not request.user.is_authenticated:
+        guest_cart = GuestCart(request.session)
+        total_items, subtotal = guest_cart.get_totals()
+        return JsonResponse({
+            'cart_count': total_items,
+            'cart_subtotal': str(subtotal),
+            'items': [
+                {
+                    'id': item.id,
+                    'product_name': item.product_name,
+                    'product_price': str(item.product_price),
+                    'product_image': item.product_image,
+                    'quantity': item.quantity,
+                    'item_total': str(item.get_total_price()),
+                }
+                for item in guest_cart.get_items()
+            ],
+        })
+
+    cart = Cart.objects.filter(user=request.user).first()
+    if cart is None:
+        return JsonResponse({'cart_count': 0, 'cart_subtotal': '0.00', 'items': []})
+
+    total_items, subtotal = cart.get_totals()
+    items = cart.items.values_list('id', 'product_name', 'product_price', 'product_image', 'quantity')
+    return JsonResponse({
+        'cart_count': total_items,
+        'cart_subtotal': str(subtotal),
+        'items': [
+            {
+                'id': item_id,
+                'product_name': product_name,
+                'product_price': str(product_price),
+                'product_image': product_image,
+                'quantity': quantity,
+                'item_total': str(product_price * quantity),
+            }
+            for item_id, product_name, product_price, product_image, quantity in items
+        ],
+    })
\ No newline at end of file
@@ -1,5 +1,17 @@
-from django.contrib import admin
-from .models import FAQ, ChatSession, ChatMessage
+import json
+from django import forms
+from django.contrib import admin, messages
+from django.db.models import Count
+from django.http import HttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from .models import FAQ, ChatSession, ChatMessage, ConfidenceRollup, FAQHitRollup, UnmatchedQueryRollup
+from .sync import load_faq_records, sync_faqs
+
+class FAQImportForm(forms.Form):
+    file = forms.FileField(help_text="JSON list or CSV with the columns key, question, answer, keywords, is_active")
+    deactivate_missing = forms.BooleanField(required=False, help_text="Deactivate FAQs that are not in the file")
 
 @admin.register(FAQ)
 class FAQAdmin(admin.ModelAdmin):
@@ -8,10 +20,11 @@ class FAQAdmin(admin.ModelAdmin):
     search_fields = ('question', 'keywords')
     list_editable = ('is_active',)
     readonly_fields = ('created_at', 'updated_at')
+    actions = ['export_as_json']
     
     fieldsets = (
         (None, {
-            'fields': ('question', 'answer', 'keywords', 'is_active')
+            'fields': ('key', 'question', 'answer', 'keywords', 'is_active')
         }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
@@ -26,6 +39,47 @@ class FAQAdmin(admin.ModelAdmin):
     def keywords_preview(self, obj):
         return obj.keywords[:30] + "..." if len(obj.keywords) > 30 else obj.keywords
     keywords_preview.short_description = 'Keywords'
+    
+    def get_urls(self):
+        return [
+            path('import/', self.admin_site.admin_view(self.import_view), name='chatbot_faq_import'),
+        ] + super().get_urls()
+    
+    def import_view(self, request):
+        """Sync FAQs from an uploaded JSON/CSV file (admin/chatbot/faq/import/)"""
+        if not self.has_add_permission(request) or not self.has_change_permission(request):
+            return redirect('admin:chatbot_faq_changelist')
+        
+        form = FAQImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['file']
+            try:
+                records = load_faq_records(upload, name=upload.name)
+            except ValueError as e:
+                form.add_error('file', str(e))
+            else:
+                counts = sync_faqs(records, deactivate_missing=form.cleaned_data['deactivate_missing'])
+                messages.success(request, (
+                    f"Created {counts['created']}, updated {counts['updated']}, "
+                    f"deactivated {counts['deactivated']} FAQs ({counts['unchanged']} unchanged)."
+                ))
+                return redirect('admin:chatbot_faq_changelist')
+        
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Import FAQs',
+            'form': form,
+        }
+        return TemplateResponse(request, 'chatbot/faq_import.html', context)
+    
+    def export_as_json(self, request, queryset):
+        """Download the selected FAQs in the import format"""
+        data = list(queryset.values('key', 'question', 'answer', 'keywords', 'is_active'))
+        response = HttpResponse(json.dumps(data, indent=4, ensure_ascii=False), content_type='application/json')
+        response['Content-Disposition'] = 'attachment; filename="faqs.json"'
+        return response
+    export_as_json.short_description = 'Export selected FAQs as JSON (for import)'
 
 @admin.register(ChatSession)
 class ChatSessionAdmin(admin.ModelAdmin):
@@ -34,17 +88,48 @@ class ChatSessionAdmin(admin.ModelAdmin):
     search_fields = ('session_id',)
     readonly_fields = ('created_at', 'last_activity', 'message_count')
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(message_total=Count('messages'))
+    
     def message_count(self, obj):
-        return obj.messages.count()
+        return obj.message_total
     message_count.short_description = 'Messages'
+    message_count.admin_order_field = 'message_total'
 
 @admin.register(ChatMessage)
 class ChatMessageAdmin(admin.ModelAdmin):
     list_display = ('session', 'user_message_preview', 'matched_faq', 'timestamp')
+    list_select_related = ('session', 'matched_faq')
     list_filter = ('timestamp', 'matched_faq')
     search_fields = ('user_message', 'bot_response')
     readonly_fields = ('timestamp',)
     
     def user_message_preview(self, obj):
         return obj.user_message[:50] + "..." if len(obj.user_message) > 50 else obj.user_message
-    user_message_preview.short_description = 'User Message'
\ No newline at end of file
+    user_message_preview.short_description = 'User Message'
+
+class RollupAdmin(admin.ModelAdmin):
+    """Read-only analytics tables, written only by the chat message writer and compaction"""
+    list_filter = ('period',)
+    date_hierarchy = 'day'
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(FAQHitRollup)
+class FAQHitRollupAdmin(RollupAdmin):
+    list_display = ('day', 'period', 'faq', 'hits')
+    list_select_related = ('faq',)
+    list_filter = ('period', 'faq')
+
+@admin.register(ConfidenceRollup)
+class ConfidenceRollupAdmin(RollupAdmin):
+    list_display = ('day', 'period', 'bucket', 'turns')
+
+@admin.register(UnmatchedQueryRollup)
+class UnmatchedQueryRollupAdmin(RollupAdmin):
+    list_display = ('day', 'period', 'query', 'count')
+    search_fields = ('query',)
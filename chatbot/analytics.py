@@ -0,0 +1,100 @@
+"""
+Incremental chat analytics: FAQ hits, confidence histogram and unmatched queries
+"""
+import re
+from collections import Counter
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from .models import ConfidenceRollup, FAQHitRollup, Granularity, UnmatchedQueryRollup
+
+# (model, counter field, grouping field) of every rollup table
+ROLLUPS = (
+    (FAQHitRollup, 'hits', 'faq_id'),
+    (ConfidenceRollup, 'turns', 'bucket'),
+    (UnmatchedQueryRollup, 'count', 'query'),
+)
+
+
+def normalize_query(message):
+    """Lowercase and drop punctuation so variants of the same question count together"""
+    message = re.sub(r'[^\w\s]', ' ', message.lower())
+    return ' '.join(message.split())[:255]
+
+
+def confidence_bucket(confidence):
+    """Lower bound of the 10 point bucket holding confidence (100 has its own)"""
+    return min(confidence // 10 * 10, 100)
+
+
+def turn_day(timestamp):
+    if timestamp is None:
+        return timezone.localdate()
+    return timezone.localdate(timestamp) if timezone.is_aware(timestamp) else timestamp.date()
+
+
+def increment(model, field, key, amount):
+    """Add amount to field of the row identified by key, creating the row if needed"""
+    if model.objects.filter(**key).update(**{field: F(field) + amount}):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **{field: amount})
+    except IntegrityError:
+        # Another writer created the row first
+        model.objects.filter(**key).update(**{field: F(field) + amount})
+
+
+def record_turns(chat_messages):
+    """
+    Fold saved chat turns into the daily rollups.
+
+    Turns are aggregated in memory first, so a batch costs one UPDATE per
+    distinct (day, FAQ), (day, bucket) and (day, query), not per turn.
+    """
+    counters = {model: Counter() for model, field, group in ROLLUPS}
+    for chat_message in chat_messages:
+        day = turn_day(chat_message.timestamp)
+        if chat_message.matched_faq_id is not None:
+            counters[FAQHitRollup][(day, chat_message.matched_faq_id)] += 1
+        if chat_message.confidence is None:
+            continue
+        counters[ConfidenceRollup][(day, confidence_bucket(chat_message.confidence))] += 1
+        # Greetings have no FAQ either, but full confidence
+        if chat_message.matched_faq_id is None and chat_message.confidence == 0:
+            query = normalize_query(chat_message.user_message)
+            if query:
+                counters[UnmatchedQueryRollup][(day, query)] += 1
+
+    with transaction.atomic():
+        for model, field, group in ROLLUPS:
+            # A fixed order keeps concurrent writers from deadlocking
+            for (day, value), amount in sorted(counters[model].items()):
+                increment(model, field, {'period': Granularity.DAY, 'day': day, group: value}, amount)
+
+
+def compact_rollups(before, keep_unmatched=100):
+    """
+    Fold daily rows older than before (a date) into monthly rows, then keep
+    only the keep_unmatched most frequent unmatched queries of each month.
+    Returns (daily rows folded, unmatched queries trimmed).
+    """
+    folded = trimmed = 0
+    with transaction.atomic():
+        for model, field, group in ROLLUPS:
+            daily = model.objects.filter(period=Granularity.DAY, day__lt=before)
+            totals = (
+                daily.annotate(month=TruncMonth('day')).order_by()
+                .values('month', group).annotate(total=Sum(field))
+            )
+            for row in totals:
+                increment(model, field, {'period': Granularity.MONTH, 'day': row['month'], group: row[group]}, row['total'])
+            folded += daily.delete()[0]
+
+        monthly = UnmatchedQueryRollup.objects.filter(period=Granularity.MONTH)
+        for month in monthly.order_by().values_list('day', flat=True).distinct():
+            rows = monthly.filter(day=month)
+            keep = list(rows.order_by('-count', 'query').values_list('pk', flat=True)[:keep_unmatched])
+            trimmed += rows.exclude(pk__in=keep).delete()[0]
+    return folded, trimmed
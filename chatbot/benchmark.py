@@ -0,0 +1,244 @@
+"""
+Synthetic FAQ corpora and message workloads for benchmarking the chatbot matchers
+"""
+import math
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from .cache import match_cache
+from .models import FAQ, ChatSession
+from .services import ChatbotService, FAQMatcher, GREETING_RESPONSES
+
+TOPICS = [
+    'sofa', 'curtain', 'cushion', 'bedsheet', 'rug', 'carpet', 'lamp', 'mirror', 'vase', 'blind',
+    'wallpaper', 'towel', 'quilt', 'pillow', 'throw', 'frame', 'planter', 'clock', 'shelf', 'table',
+]
+ACTIONS = [
+    'return', 'refund', 'exchange', 'ship', 'deliver', 'track', 'cancel', 'customize', 'install',
+    'clean', 'wash', 'repair', 'replace', 'order', 'pay', 'measure', 'assemble', 'store',
+]
+QUALIFIERS = [
+    'cotton', 'velvet', 'linen', 'silk', 'wooden', 'metal', 'damaged', 'broken', 'large', 'small',
+    'blackout', 'outdoor', 'custom', 'express', 'standard', 'bulk', 'gift', 'discounted',
+]
+QUESTION_TEMPLATES = [
+    'How do I {action} my {qualifier} {topic}?',
+    'Can I {action} a {qualifier} {topic} after delivery?',
+    'What is the policy to {action} {qualifier} {topic} orders?',
+    'How long does it take to {action} a {topic}?',
+    'Is it possible to {action} the {topic} if it is {qualifier}?',
+]
+FILLER = 'i would like to know please tell me about the when where why what is my order for'.split()
+
+WORKLOADS = ('short', 'long', 'typo', 'greeting')
+ENGINES = ('keyword', 'compiled', 'tfidf')
+
+
+def generate_faqs(count, rng, key_prefix='synthetic-'):
+    """Return unsaved FAQs with realistic questions and keyword lists, keyed key_prefix + number"""
+    faqs = []
+    for number in range(count):
+        topic, action, qualifier = rng.choice(TOPICS), rng.choice(ACTIONS), rng.choice(QUALIFIERS)
+        question = rng.choice(QUESTION_TEMPLATES).format(topic=topic, action=action, qualifier=qualifier)
+        keywords = {topic, action, qualifier, f'{action} {topic}', f'{qualifier} {topic}'}
+        keywords.update(rng.sample(TOPICS + ACTIONS + QUALIFIERS, 2))
+        faqs.append(FAQ(
+            key=f'{key_prefix}{number}',
+            question=question,
+            answer=f'Synthetic answer {number} about how to {action} a {qualifier} {topic}.',
+            keywords=','.join(sorted(keywords)),
+            is_active=True
+        ))
+    return faqs
+
+
+def add_typo(word, rng):
+    if len(word) < 4:
+        return word
+    position = rng.randrange(1, len(word) - 1)
+    kind = rng.choice(('drop', 'swap', 'double'))
+    if kind == 'drop':
+        return word[:position] + word[position + 1:]
+    if kind == 'swap':
+        return word[:position - 1] + word[position] + word[position - 1] + word[position + 1:]
+    return word[:position] + word[position] + word[position:]
+
+
+def generate_messages(kind, count, rng):
+    """Return count messages of the given workload kind"""
+    messages = []
+    for _ in range(count):
+        words = [rng.choice(ACTIONS), rng.choice(QUALIFIERS), rng.choice(TOPICS)]
+        if kind == 'short':
+            message = ' '.join(words)
+        elif kind == 'long':
+            filler = rng.sample(FILLER, 10)
+            message = ' '.join(filler[:5] + words + filler[5:] + rng.sample(TOPICS + ACTIONS, 6))
+        elif kind == 'typo':
+            message = ' '.join(add_typo(word, rng) for word in rng.sample(FILLER, 3) + words)
+        elif kind == 'greeting':
+            message = f'{rng.choice(list(GREETING_RESPONSES))} {" ".join(words)}'
+        else:
+            raise ValueError(f"Unknown workload: {kind}")
+        messages.append(message)
+    return messages
+
+
+class BenchmarkMatcher(FAQMatcher):
+    """
+    Matcher over one synthetic corpus, isolated from the process-wide faq_matcher.
+
+    It only sees FAQs whose key starts with key_prefix, keeps its version stamp
+    in a private cache and compiles to its own file, so a benchmark never bumps
+    the shared FAQ version or overwrites the production index file.
+    """
+
+    def __init__(self, key_prefix, compiled_path=None):
+        super().__init__()
+        self.key_prefix = key_prefix
+        self._cache = LocMemCache(f'chatbot-benchmark-{key_prefix}', {})
+        self._compiled_path = compiled_path
+
+    @property
+    def compiled_path(self):
+        return self._compiled_path
+
+    @property
+    def cache(self):
+        return self._cache
+
+    def active_faqs(self):
+        return list(FAQ.objects.filter(is_active=True, key__startswith=self.key_prefix))
+
+    def schedule_compile(self):
+        # The synthetic rows only exist in the benchmark transaction, a
+        # background rebuild could not see them; run_benchmark compiles itself
+        pass
+
+
+def percentile(sorted_values, percent):
+    if not sorted_values:
+        return 0.0
+    rank = max(int(math.ceil(percent / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[rank]
+
+
+def measure(function, messages):
+    """Time function over messages, returning latency percentiles, throughput and query count"""
+    latencies = []
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        for message in messages:
+            begin = time.perf_counter()
+            function(message)
+            latencies.append(time.perf_counter() - begin)
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'throughput': len(messages) / elapsed if elapsed else 0.0,
+        'queries': len(queries.captured_queries),
+    }
+
+
+def peak_memory(matcher, function, messages):
+    """Peak Python allocations (bytes) while compiling the index and answering messages"""
+    matcher.invalidate()
+    tracemalloc.start()
+    try:
+        if matcher.compiled_path:
+            matcher.compile()
+        for message in messages:
+            function(message)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_benchmark(sizes, engines, workloads=WORKLOADS, message_count=200, seed=0, report=None):
+    """
+    Benchmark each engine against synthetic corpora of the given sizes.
+
+    The synthetic FAQs are inserted inside a transaction that is rolled back
+    and matched by a private BenchmarkMatcher, so existing FAQs are neither
+    modified nor locked and the process-wide matcher is never invalidated.
+    The match cache and analytics rollups are disabled so every message is
+    really scored and no shared counter rows are touched.
+    """
+    rng = random.Random(seed)
+    results = []
+    directory = tempfile.mkdtemp(prefix='chatbot-benchmark-')
+
+    overrides = {
+        'CHATBOT_MATCH_CACHE_BACKEND': None,
+        'CHATBOT_WRITE_BEHIND': False,
+        'CHATBOT_ANALYTICS_ROLLUPS': False,
+    }
+    with override_settings(**overrides):
+        match_cache.reset()
+        try:
+            for size in sizes:
+                key_prefix = f'benchmark-{seed}-{size}-'
+                with transaction.atomic():
+                    FAQ.objects.bulk_create(generate_faqs(size, rng, key_prefix), batch_size=1000)
+                    session = ChatSession.objects.create(session_id=f'benchmark-{size}-{seed}')
+
+                    for engine in engines:
+                        compiled_path = os.path.join(directory, f'{size}.idx') if engine == 'compiled' else None
+                        matcher = BenchmarkMatcher(key_prefix, compiled_path)
+                        service = ChatbotService(matcher)
+                        service_engine = 'tfidf' if engine == 'tfidf' else 'keyword'
+
+                        def match(message, service=service, service_engine=service_engine):
+                            return service.match_messages([message], service_engine)
+
+                        def respond(message, service=service, service_engine=service_engine):
+                            return service.get_response(message, session, service_engine)
+
+                        started = time.perf_counter()
+                        if compiled_path:
+                            matcher.compile()
+                        matcher.get_index()
+                        if engine == 'tfidf':
+                            matcher.get_tfidf_index()
+                        build_ms = (time.perf_counter() - started) * 1000
+
+                        for workload in workloads:
+                            messages = generate_messages(workload, message_count, rng)
+                            for operation, function in (('match', match), ('get_response', respond)):
+                                result = {
+                                    'size': size,
+                                    'engine': engine,
+                                    'workload': workload,
+                                    'operation': operation,
+                                    'build_ms': build_ms,
+                                }
+                                result.update(measure(function, messages))
+                                results.append(result)
+                                if report:
+                                    report(result)
+
+                        # A few messages of every workload, not whatever the last loop left behind
+                        probe = [message for workload in workloads for message in generate_messages(workload, 5, rng)]
+                        memory = {
+                            'size': size,
+                            'engine': engine,
+                            'peak_memory_bytes': peak_memory(matcher, match, probe),
+                        }
+                        results.append(memory)
+                        if report:
+                            report(memory)
+
+                    transaction.set_rollback(True)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    match_cache.reset()
+    return results
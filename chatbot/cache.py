@@ -0,0 +1,139 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+
+class LocalResponseCache:
+    """Bounded in-process LRU cache whose entries expire after a TTL"""
+
+    def __init__(self, max_size=1024, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DjangoResponseCache:
+    """Response cache on a Django cache alias, shared by every worker using it"""
+
+    def __init__(self, max_size=None, ttl=300, alias='default'):
+        self.ttl = ttl
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value, self.ttl)
+
+    def clear(self):
+        # Keys embed the FAQ version, so stale entries are simply never read again
+        pass
+
+
+BACKENDS = {
+    'local': LocalResponseCache,
+    'django': DjangoResponseCache,
+}
+
+
+class MatchCache:
+    """Caches match results per normalized message and FAQ version, counting hits and misses"""
+
+    def __init__(self):
+        self._backend = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = self.create_backend()
+        return self._backend
+
+    def create_backend(self):
+        """Instantiate the backend named by CHATBOT_MATCH_CACHE_BACKEND (None disables caching)"""
+        name = getattr(settings, 'CHATBOT_MATCH_CACHE_BACKEND', 'local')
+        if not name:
+            return None
+        backend_class = BACKENDS.get(name) or import_string(name)
+        options = {
+            'max_size': getattr(settings, 'CHATBOT_MATCH_CACHE_SIZE', 1024),
+            'ttl': getattr(settings, 'CHATBOT_MATCH_CACHE_TTL', 300),
+        }
+        if backend_class is DjangoResponseCache:
+            options['alias'] = getattr(settings, 'CHATBOT_MATCH_CACHE_ALIAS', 'default')
+        return backend_class(**options)
+
+    def make_key(self, engine, version, processed_message):
+        digest = hashlib.sha1(processed_message.encode('utf-8')).hexdigest()
+        return f'chatbot:match:{engine}:{version}:{digest}'
+
+    def get(self, engine, version, processed_message):
+        """Return the cached (faq id, confidence) or None on a miss"""
+        value = None
+        if self.backend is not None:
+            value = self.backend.get(self.make_key(engine, version, processed_message))
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, engine, version, processed_message, value):
+        if self.backend is not None:
+            self.backend.set(self.make_key(engine, version, processed_message), value)
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    def reset(self):
+        """Forget the backend and counters so they are recreated from the current settings"""
+        with self._lock:
+            self._backend = None
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+match_cache = MatchCache()
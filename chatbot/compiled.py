@@ -0,0 +1,254 @@
+"""
+FAQ keyword index compiled to a read-only binary file.
+
+Every worker mmaps the same file, so questions, answers and the token,
+keyword and question word postings live once in the page cache instead of
+once per process, and workers start without reading the FAQ table. What a
+worker still builds for itself is sized by the vocabulary, not by the
+number of FAQs: the phrase automaton over the keywords and question words,
+and the keyword set and token -> keyword map it is scanned with. Layout
+(little-endian unless noted):
+
+    header    magic, faq/token/keyword/question word counts, build id, section offsets
+    faqs      per FAQ: id, then (offset, length) of question, answer, keywords
+    ids       uint32 FAQ positions ordered by FAQ id (native byte order)
+    tokens    sorted by UTF-8 bytes: (offset, length) of the token, postings start, count
+    keywords  same records, postings once per FAQ listing the keyword
+    questions same records, postings once per occurrence of the question word
+    postings  uint32 FAQ positions (native byte order)
+    strings   UTF-8 blob the offsets point into
+"""
+import mmap
+import os
+import struct
+import tempfile
+import uuid
+from array import array
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from .models import FAQ
+from .services import (
+    FAQEntry, FAQIndex, GREETING_RESPONSES, SubstringIndex, TrigramIndex, build_automaton, keywords_by_token,
+    normalize_token
+)
+
+MAGIC = b'DDFAQIX2'
+HEADER = struct.Struct('<8sIIII32sQQQQQQQ')
+FAQ_RECORD = struct.Struct('<qIIIIII')
+TOKEN_RECORD = struct.Struct('<IIII')
+
+
+def compile_faq_index(faqs, path):
+    """Write faqs (in matching order) to path, atomically replacing any previous file"""
+    index = FAQIndex(faqs)
+    strings = bytearray()
+    postings = array('I')
+    if postings.itemsize != 4:
+        raise ImproperlyConfigured("The compiled FAQ index needs 4 byte unsigned integers")
+
+    def add_string(text):
+        data = text.encode('utf-8')
+        offset = len(strings)
+        strings.extend(data)
+        return offset, len(data)
+
+    def term_table(term_postings):
+        table = bytearray()
+        for term in sorted(term_postings, key=lambda term: term.encode('utf-8')):
+            positions = term_postings[term]
+            if isinstance(positions, set):
+                positions = sorted(positions)
+            table += TOKEN_RECORD.pack(*add_string(term), len(postings), len(positions))
+            postings.extend(positions)
+        return table
+
+    faq_table = bytearray()
+    for entry in index.entries:
+        faq = entry.faq
+        faq_table += FAQ_RECORD.pack(
+            faq.id,
+            *add_string(faq.question),
+            *add_string(faq.answer),
+            *add_string('\n'.join(entry.keywords)),
+        )
+    ids = array('I', sorted(range(len(index.entries)), key=lambda position: index.entries[position].faq.id))
+    tables = [term_table(index.postings), term_table(index.keyword_postings), term_table(index.question_postings)]
+    counts = [len(table) // TOKEN_RECORD.size for table in tables]
+
+    sections = [faq_table, ids.tobytes(), *tables, postings.tobytes(), strings]
+    offsets = []
+    offset = HEADER.size
+    for section in sections:
+        offsets.append(offset)
+        offset += len(section)
+    header = HEADER.pack(MAGIC, len(index.entries), *counts, uuid.uuid4().hex.encode('ascii'), *offsets)
+
+    # Write next to the target and rename over it, readers never see a partial file
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temporary_path = tempfile.mkstemp(prefix='.faq-index-', dir=directory)
+    try:
+        with os.fdopen(descriptor, 'wb') as output:
+            output.write(header)
+            for section in sections:
+                output.write(section)
+            output.flush()
+            os.fsync(output.fileno())
+        os.chmod(temporary_path, 0o644)
+        os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+    return len(index.entries), counts[0]
+
+
+class MappedEntries:
+    """FAQEntry objects decoded from the file on use, keeping at most max_size of them"""
+
+    def __init__(self, index, max_size=1024):
+        self.index = index
+        self.max_size = max_size
+        self._entries = {}
+
+    def __len__(self):
+        return self.index.faq_count
+
+    def __getitem__(self, position):
+        entry = self._entries.get(position)
+        if entry is None:
+            faq_id, question, answer, keywords = self.index.faq_record(position)
+            faq = FAQ(id=faq_id, question=question, answer=answer, keywords=keywords.replace('\n', ','), is_active=True)
+            entry = FAQEntry(faq, position)
+            if len(self._entries) >= self.max_size:
+                self._entries.clear()
+            self._entries[position] = entry
+        return entry
+
+
+class MappedPostings:
+    """
+    Term -> FAQ positions over a mapped term table. Only the term -> span map
+    is held per process, the positions come back as a read-only view of the
+    file, or as a set for the token postings (as_set) like FAQIndex.postings.
+    """
+
+    def __init__(self, index, offset, count, as_set=False):
+        self.index = index
+        self.as_set = as_set
+        self.spans = {
+            index.string(string_offset, length): (start, size)
+            for string_offset, length, start, size in TOKEN_RECORD.iter_unpack(
+                index.buffer[offset:offset + count * TOKEN_RECORD.size]
+            )
+        }
+
+    def __len__(self):
+        return len(self.spans)
+
+    def __iter__(self):
+        return iter(self.spans)
+
+    def __contains__(self, term):
+        return term in self.spans
+
+    def __getitem__(self, term):
+        positions = self.get(term)
+        if positions is None:
+            raise KeyError(term)
+        return positions
+
+    def get(self, term, default=None):
+        span = self.spans.get(term)
+        if span is None:
+            return default
+        positions = self.index.positions[span[0]:span[0] + span[1]]
+        return set(positions) if self.as_set else positions
+
+
+class MappedFAQs:
+    """faqs_by_id for a mapped index, by binary search over the id table"""
+
+    def __init__(self, index):
+        self.index = index
+
+    def get(self, faq_id, default=None):
+        low, high = 0, self.index.faq_count
+        while low < high:
+            middle = (low + high) // 2
+            position = self.index.ids[middle]
+            found = self.index.faq_id(position)
+            if found == faq_id:
+                return self.index.entries[position].faq
+            if found < faq_id:
+                low = middle + 1
+            else:
+                high = middle
+        return default
+
+
+class MappedFAQIndex(FAQIndex):
+    """FAQIndex answering from a file written by compile_faq_index, mapped read-only"""
+
+    def __init__(self, path, greetings=GREETING_RESPONSES):
+        self.path = path
+        with open(path, 'rb') as source:
+            self.buffer = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (
+                magic, self.faq_count, token_count, keyword_count, question_count, build_id,
+                self.faq_offset, ids_offset, token_offset, keyword_offset, question_offset,
+                postings_offset, self.strings_offset
+            ) = HEADER.unpack_from(self.buffer, 0)
+        except struct.error:
+            magic = None
+        if magic != MAGIC:
+            raise ImproperlyConfigured(f"{path} is not a compiled FAQ index, rebuild it with compile_faq_index")
+        self.build_id = build_id.decode('ascii')
+        view = memoryview(self.buffer)
+        self.ids = view[ids_offset:token_offset].cast('I')
+        self.positions = view[postings_offset:self.strings_offset].cast('I')
+
+        self.entries = MappedEntries(self, getattr(settings, 'CHATBOT_COMPILED_ENTRY_CACHE_SIZE', 1024))
+        self.postings = MappedPostings(self, token_offset, token_count, as_set=True)
+        # Scoring runs on these postings alone, FAQs are only decoded to answer
+        self.keyword_postings = MappedPostings(self, keyword_offset, keyword_count)
+        self.question_postings = MappedPostings(self, question_offset, question_count)
+        self.faqs_by_id = MappedFAQs(self)
+
+        self.greetings = list(greetings)
+        self.keyword_set = frozenset(self.keyword_postings)
+        self.token_keywords = keywords_by_token(self.keyword_set)
+        self.automaton = build_automaton(self.greetings, self.keyword_set, self.question_postings)
+        self._trigrams = None
+        self._substrings = None
+
+    @property
+    def trigrams(self):
+        # Only tokens are needed, built on the first fuzzy lookup
+        if self._trigrams is None:
+            self._trigrams = TrigramIndex(
+                (normalize_token(token) for token in self.postings),
+                max_candidates=getattr(settings, 'CHATBOT_FUZZY_MAX_CANDIDATES', 20)
+            )
+        return self._trigrams
+
+    @property
+    def substrings(self):
+        if self._substrings is None:
+            self._substrings = SubstringIndex(self.keyword_set)
+        return self._substrings
+
+    def string_bytes(self, offset, length):
+        start = self.strings_offset + offset
+        return self.buffer[start:start + length]
+
+    def string(self, offset, length):
+        return self.string_bytes(offset, length).decode('utf-8')
+
+    def faq_id(self, position):
+        return FAQ_RECORD.unpack_from(self.buffer, self.faq_offset + position * FAQ_RECORD.size)[0]
+
+    def faq_record(self, position):
+        """Return (id, question, answer, newline-separated keywords) of the FAQ at position"""
+        faq_id, *spans = FAQ_RECORD.unpack_from(self.buffer, self.faq_offset + position * FAQ_RECORD.size)
+        return (faq_id, *(self.string(spans[i], spans[i + 1]) for i in range(0, 6, 2)))
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+from chatbot.benchmark import ENGINES, WORKLOADS, run_benchmark
+from chatbot.services import tfidf_available
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the chatbot matching engines on synthetic FAQ corpora. "
+        "Synthetic rows are rolled back and existing FAQs are left untouched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,100,1000,10000',
+                            help='Comma-separated FAQ corpus sizes (up to 100000)')
+        parser.add_argument('--engines',
+                            help='Comma-separated matching engines (default: every engine installed)')
+        parser.add_argument('--workloads', default=','.join(WORKLOADS),
+                            help='Comma-separated message workloads')
+        parser.add_argument('--messages', type=int, default=200,
+                            help='Messages per workload')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('--sizes must be a comma-separated list of integers')
+        if options['engines'] is None:
+            engines = [engine for engine in ENGINES if engine != 'tfidf' or tfidf_available()]
+            if len(engines) < len(ENGINES):
+                self.stderr.write('Skipping the tfidf engine, it requires numpy and scipy')
+        else:
+            engines = [engine for engine in options['engines'].split(',') if engine]
+        workloads = [workload for workload in options['workloads'].split(',') if workload]
+
+        unknown = set(workloads) - set(WORKLOADS)
+        if unknown:
+            raise CommandError(f"Unknown workloads: {', '.join(sorted(unknown))}")
+        unknown = set(engines) - set(ENGINES)
+        if unknown:
+            raise CommandError(f"Unknown engines: {', '.join(sorted(unknown))}")
+        if 'tfidf' in engines and not tfidf_available():
+            raise CommandError('The tfidf engine requires numpy and scipy')
+
+        self.stdout.write(
+            f"{'faqs':>7} {'engine':<8} {'workload':<9} {'operation':<13} {'build ms':>9} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'msg/s':>9} {'queries':>8}"
+        )
+        run_benchmark(sizes, engines, workloads, options['messages'], options['seed'], report=self.report)
+
+    def report(self, result):
+        if 'peak_memory_bytes' in result:
+            self.stdout.write(
+                f"{result['size']:>7} {result['engine']:<8} peak memory "
+                f"{result['peak_memory_bytes'] / (1024 * 1024):.1f} MiB"
+            )
+            return
+        self.stdout.write(
+            f"{result['size']:>7} {result['engine']:<8} {result['workload']:<9} {result['operation']:<13} "
+            f"{result['build_ms']:>9.1f} {result['p50_ms']:>8.3f} {result['p95_ms']:>8.3f} "
+            f"{result['p99_ms']:>8.3f} {result['throughput']:>9.0f} {result['queries']:>8}"
+        )
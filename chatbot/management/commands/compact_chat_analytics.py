@@ -0,0 +1,21 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from chatbot.analytics import compact_rollups
+
+
+class Command(BaseCommand):
+    help = "Fold old daily chat analytics rows into monthly ones and trim the unmatched-query long tail"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90,
+                            help='Keep daily rows for this many days')
+        parser.add_argument('--keep-unmatched', type=int, default=100,
+                            help='Unmatched queries kept per month')
+
+    def handle(self, *args, **options):
+        before = timezone.localdate() - timedelta(days=options['days'])
+        folded, trimmed = compact_rollups(before, keep_unmatched=options['keep_unmatched'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Folded {folded} daily rows before {before} into monthly rows, trimmed {trimmed} unmatched queries"
+        ))
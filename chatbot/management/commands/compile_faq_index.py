@@ -0,0 +1,29 @@
+import os
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from chatbot.services import faq_matcher
+
+
+class Command(BaseCommand):
+    help = (
+        "Compile the active FAQs into the binary index file workers mmap "
+        "(CHATBOT_COMPILED_INDEX_PATH). The file is swapped atomically."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=getattr(settings, 'CHATBOT_COMPILED_INDEX_PATH', None),
+                            help='File to write (defaults to CHATBOT_COMPILED_INDEX_PATH)')
+
+    def handle(self, *args, **options):
+        path = options['output']
+        if not path:
+            raise CommandError('Set CHATBOT_COMPILED_INDEX_PATH or pass --output')
+
+        started = time.perf_counter()
+        faqs, tokens = faq_matcher.compile(path)
+        elapsed = (time.perf_counter() - started) * 1000
+        self.stdout.write(self.style.SUCCESS(
+            f"Compiled {faqs} FAQs and {tokens} tokens into {path} "
+            f"({os.path.getsize(path)} bytes, {elapsed:.0f} ms)"
+        ))
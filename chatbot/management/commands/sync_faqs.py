@@ -0,0 +1,38 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from chatbot.sync import INITIAL_FAQS_PATH, load_faq_records, sync_faqs
+
+
+class Command(BaseCommand):
+    help = (
+        "Create or update FAQs from a JSON or CSV file in one transaction, matched by key "
+        "(or question). Without a file, the initial FAQ set is synced."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=INITIAL_FAQS_PATH,
+                            help='JSON or CSV file (defaults to the initial FAQ set)')
+        parser.add_argument('--format', choices=['json', 'csv'],
+                            help='File format (defaults to the file extension)')
+        parser.add_argument('--deactivate-missing', action='store_true',
+                            help='Deactivate FAQs that are not in the file')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report the changes without saving them')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            with open(options['path'], 'rb') as source:
+                records = load_faq_records(source, options['format'], options['path'])
+        except OSError as e:
+            raise CommandError(f"Cannot read {options['path']}: {e}")
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        counts = sync_faqs(records, deactivate_missing=options['deactivate_missing'], dry_run=options['dry_run'])
+        elapsed = time.perf_counter() - started
+        prefix = "Dry run: would have " if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}created {counts['created']}, updated {counts['updated']}, "
+            f"deactivated {counts['deactivated']} FAQs ({counts['unchanged']} unchanged) in {elapsed:.1f}s"
+        ))
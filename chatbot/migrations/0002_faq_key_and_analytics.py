@@ -0,0 +1,89 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:21
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConfidenceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Day'), ('month', 'Month')], default='day', max_length=5)),
+                ('day', models.DateField(help_text='The day, or the first day of the month for monthly rows')),
+                ('bucket', models.PositiveSmallIntegerField(help_text='Lower bound of the confidence bucket')),
+                ('turns', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-day', 'bucket'],
+            },
+        ),
+        migrations.CreateModel(
+            name='FAQHitRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Day'), ('month', 'Month')], default='day', max_length=5)),
+                ('day', models.DateField(help_text='The day, or the first day of the month for monthly rows')),
+                ('hits', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-day', '-hits'],
+            },
+        ),
+        migrations.CreateModel(
+            name='UnmatchedQueryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Day'), ('month', 'Month')], default='day', max_length=5)),
+                ('day', models.DateField(help_text='The day, or the first day of the month for monthly rows')),
+                ('query', models.CharField(max_length=255)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-day', '-count'],
+            },
+        ),
+        migrations.AddField(
+            model_name='chatmessage',
+            name='confidence',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='faq',
+            name='key',
+            field=models.SlugField(blank=True, help_text='Stable identifier used to match rows when FAQs are synced from a file', max_length=100, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['session', 'timestamp', 'id'], name='chatmsg_session_ts_id_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='confidencerollup',
+            unique_together={('period', 'day', 'bucket')},
+        ),
+        migrations.AddField(
+            model_name='faqhitrollup',
+            name='faq',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hit_rollups', to='chatbot.faq'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='unmatchedqueryrollup',
+            unique_together={('period', 'day', 'query')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='faqhitrollup',
+            unique_together={('period', 'day', 'faq')},
+        ),
+    ]
@@ -0,0 +1,50 @@
+"""
+Give FAQs created before FAQ.key existed a key, and seed an empty table
+"""
+import json
+import os
+from django.db import migrations
+from django.utils.text import slugify
+
+INITIAL_FAQS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'initial_faqs.json')
+
+
+def backfill_keys(apps, schema_editor):
+    FAQ = apps.get_model('chatbot', 'FAQ')
+    with open(INITIAL_FAQS_PATH, encoding='utf-8') as source:
+        initial = json.load(source)
+
+    faqs = list(FAQ.objects.order_by('pk'))
+    if not faqs:
+        # Fresh install: the chatbot answers from the start, without a sync_faqs run
+        FAQ.objects.bulk_create([FAQ(**record) for record in initial])
+        return
+
+    # Rows seeded by the old per-visit populate get the key the initial file uses,
+    # so the next sync_faqs updates them instead of creating duplicates
+    initial_keys = {record['question']: record['key'] for record in initial}
+    taken = {faq.key for faq in faqs if faq.key}
+    to_update = []
+    for faq in faqs:
+        if faq.key:
+            continue
+        key = initial_keys.get(faq.question)
+        if key is None or key in taken:
+            key = slugify(faq.question)[:80].strip('-') or 'faq'
+            if key in taken:
+                key = f'{key}-{faq.pk}'
+        taken.add(key)
+        faq.key = key
+        to_update.append(faq)
+    FAQ.objects.bulk_update(to_update, ['key'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0002_faq_key_and_analytics'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_keys, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,9 @@
 from django.db import models
+from django.utils import timezone
 
 class FAQ(models.Model):
+    key = models.SlugField(max_length=100, unique=True, null=True, blank=True,
+                           help_text="Stable identifier used to match rows when FAQs are synced from a file")
     question = models.TextField(help_text="The question users might ask")
     answer = models.TextField(help_text="The response to give")
     keywords = models.TextField(help_text="Comma-separated keywords for matching")
@@ -33,10 +36,62 @@ class ChatMessage(models.Model):
     user_message = models.TextField()
     bot_response = models.TextField()
     matched_faq = models.ForeignKey(FAQ, on_delete=models.SET_NULL, null=True, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    confidence = models.PositiveSmallIntegerField(null=True, blank=True)
+    # Stamped when the turn is built, not when a write-behind batch is flushed
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # Keeps each history page a range scan on (session, timestamp, id)
+            models.Index(fields=['session', 'timestamp', 'id'], name='chatmsg_session_ts_id_idx'),
+        ]
     
     def __str__(self):
-        return f"Chat at {self.timestamp}"
\ No newline at end of file
+        return f"Chat at {self.timestamp}"
+
+class Granularity(models.TextChoices):
+    DAY = 'day', 'Day'
+    MONTH = 'month', 'Month'
+
+class FAQHitRollup(models.Model):
+    """Chat turns answered by each FAQ per period, kept up to date as turns are recorded"""
+    period = models.CharField(max_length=5, choices=Granularity.choices, default=Granularity.DAY)
+    day = models.DateField(help_text="The day, or the first day of the month for monthly rows")
+    faq = models.ForeignKey(FAQ, on_delete=models.CASCADE, related_name='hit_rollups')
+    hits = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-day', '-hits']
+        unique_together = ['period', 'day', 'faq']
+    
+    def __str__(self):
+        return f"{self.faq_id} on {self.day}: {self.hits} hits"
+
+class ConfidenceRollup(models.Model):
+    """Chat turns per period and confidence bucket (0-9, 10-19, ..., 100)"""
+    period = models.CharField(max_length=5, choices=Granularity.choices, default=Granularity.DAY)
+    day = models.DateField(help_text="The day, or the first day of the month for monthly rows")
+    bucket = models.PositiveSmallIntegerField(help_text="Lower bound of the confidence bucket")
+    turns = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-day', 'bucket']
+        unique_together = ['period', 'day', 'bucket']
+    
+    def __str__(self):
+        return f"{self.day} confidence {self.bucket}+: {self.turns} turns"
+
+class UnmatchedQueryRollup(models.Model):
+    """Normalized messages that matched no FAQ, counted per period"""
+    period = models.CharField(max_length=5, choices=Granularity.choices, default=Granularity.DAY)
+    day = models.DateField(help_text="The day, or the first day of the month for monthly rows")
+    query = models.CharField(max_length=255)
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-day', '-count']
+        unique_together = ['period', 'day', 'query']
+    
+    def __str__(self):
+        return f"{self.query!r} on {self.day}: {self.count}"
@@ -0,0 +1,155 @@
+import atexit
+import logging
+import threading
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from .analytics import record_turns
+from .models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+
+class ChatMessageWriter:
+    """Write-behind buffer for chat turns, flushed with bulk_create on size or age"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = []
+        self._timer = None
+        # Turns saved synchronously, waiting to be counted in the analytics rollups
+        self._unrolled = []
+        self._rollup_timer = None
+        # Flush whatever is still buffered when the worker shuts down
+        atexit.register(self.flush)
+        atexit.register(self.flush_rollups)
+
+    @property
+    def write_behind(self):
+        return getattr(settings, 'CHATBOT_WRITE_BEHIND', False)
+
+    def record(self, chat_message):
+        """Save one chat turn, immediately or on the next flush"""
+        self.record_many([chat_message])
+
+    def record_many(self, chat_messages):
+        """Save several chat turns, immediately or on the next flush"""
+        if not self.write_behind:
+            # Synchronous mode, used by default and in tests
+            ChatMessage.objects.bulk_create(chat_messages)
+            transaction.on_commit(lambda: self._defer_roll_up(chat_messages))
+            return
+
+        if self._buffer(chat_messages):
+            self.flush()
+
+    async def arecord(self, chat_message):
+        """Async record, never blocking the event loop on a synchronous write"""
+        if not self.write_behind:
+            await chat_message.asave()
+            self._defer_roll_up([chat_message])
+            return
+
+        if self._buffer([chat_message]):
+            await sync_to_async(self.flush)()
+
+    def _buffer(self, chat_messages):
+        """Queue chat turns, returning True once the batch is full"""
+        batch_size = getattr(settings, 'CHATBOT_WRITE_BEHIND_BATCH_SIZE', 100)
+        with self._lock:
+            self._pending.extend(chat_messages)
+            full = len(self._pending) >= batch_size
+            if not full and self._timer is None:
+                interval = getattr(settings, 'CHATBOT_WRITE_BEHIND_INTERVAL', 2.0)
+                self._timer = threading.Timer(interval, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        return full
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """Write every buffered chat turn, returning how many were saved"""
+        with self._lock:
+            batch, self._pending = self._pending, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not batch:
+            return 0
+
+        try:
+            ChatMessage.objects.bulk_create(batch)
+        except Exception:
+            logger.exception("Bulk insert of %d chat messages failed, retrying one by one", len(batch))
+        else:
+            self._roll_up(batch)
+            return len(batch)
+
+        # One bad row (e.g. an FAQ deleted meanwhile) should not drop the whole batch
+        saved = []
+        for chat_message in batch:
+            try:
+                chat_message.save()
+                saved.append(chat_message)
+            except Exception:
+                logger.exception("Dropping chat message for session %s", chat_message.session_id)
+        self._roll_up(saved)
+        return len(saved)
+
+    def _defer_roll_up(self, chat_messages):
+        """
+        Queue synchronously saved turns for the rollups, counted in batches off
+        the request thread so requests never contend on the hot counter rows.
+        """
+        if not getattr(settings, 'CHATBOT_ANALYTICS_ROLLUPS', True):
+            return
+        batch_size = getattr(settings, 'CHATBOT_WRITE_BEHIND_BATCH_SIZE', 100)
+        with self._lock:
+            self._unrolled.extend(chat_messages)
+            full = len(self._unrolled) >= batch_size
+            if self._rollup_timer is not None and full:
+                self._rollup_timer.cancel()
+                self._rollup_timer = None
+            if self._rollup_timer is None:
+                interval = 0 if full else getattr(settings, 'CHATBOT_WRITE_BEHIND_INTERVAL', 2.0)
+                self._rollup_timer = threading.Timer(interval, self._flush_rollups_from_timer)
+                self._rollup_timer.daemon = True
+                self._rollup_timer.start()
+
+    def flush_rollups(self):
+        """Count every queued turn in the rollups, returning how many were counted"""
+        with self._lock:
+            batch, self._unrolled = self._unrolled, []
+            if self._rollup_timer is not None:
+                self._rollup_timer.cancel()
+                self._rollup_timer = None
+        self._roll_up(batch)
+        return len(batch)
+
+    def _roll_up(self, chat_messages):
+        """Count saved turns in the analytics rollups, never failing the write itself"""
+        if not chat_messages or not getattr(settings, 'CHATBOT_ANALYTICS_ROLLUPS', True):
+            return
+        try:
+            record_turns(chat_messages)
+        except Exception:
+            logger.exception("Updating chat analytics for %d messages failed", len(chat_messages))
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        finally:
+            # The timer thread opened its own connection, do not leak it
+            connection.close()
+
+    def _flush_rollups_from_timer(self):
+        try:
+            self.flush_rollups()
+        finally:
+            connection.close()
+
+
+chat_message_writer = ChatMessageWriter()
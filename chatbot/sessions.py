@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from .models import ChatSession
+
+
+class SessionResolver:
+    """Resolves chat session ids to ChatSession rows without touching the row on every turn"""
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'CHATBOT_SESSION_CACHE_ALIAS', 'default')]
+
+    def pk_key(self, session_id):
+        return f'chatbot:session:{session_id}'
+
+    def touch_key(self, pk):
+        return f'chatbot:session_touch:{pk}'
+
+    @property
+    def pk_ttl(self):
+        return getattr(settings, 'CHATBOT_SESSION_CACHE_TTL', 3600)
+
+    @property
+    def touch_interval(self):
+        return getattr(settings, 'CHATBOT_SESSION_TOUCH_INTERVAL', 60)
+
+    def resolve(self, session_id):
+        """Return the session for session_id, creating it on first use"""
+        pk = self.cache.get(self.pk_key(session_id))
+        if pk is None:
+            session, created = ChatSession.objects.get_or_create(session_id=session_id)
+            self.cache.set(self.pk_key(session_id), session.pk, self.pk_ttl)
+            if created:
+                # A new session's last_activity is already current
+                self.cache.add(self.touch_key(session.pk), True, self.touch_interval)
+            else:
+                self.touch(session.pk)
+            return session
+
+        self.touch(pk)
+        return ChatSession(pk=pk, session_id=session_id)
+
+    def touch(self, pk):
+        """Bump last_activity with a single UPDATE at most once per interval, across workers"""
+        if self.cache.add(self.touch_key(pk), True, self.touch_interval):
+            ChatSession.objects.filter(pk=pk).update(last_activity=timezone.now())
+
+    async def aresolve(self, session_id):
+        """Async resolve"""
+        pk = await self.cache.aget(self.pk_key(session_id))
+        if pk is None:
+            session, created = await ChatSession.objects.aget_or_create(session_id=session_id)
+            await self.cache.aset(self.pk_key(session_id), session.pk, self.pk_ttl)
+            if created:
+                await self.cache.aadd(self.touch_key(session.pk), True, self.touch_interval)
+            else:
+                await self.atouch(session.pk)
+            return session
+
+        await self.atouch(pk)
+        return ChatSession(pk=pk, session_id=session_id)
+
+    async def atouch(self, pk):
+        """Async touch"""
+        if await self.cache.aadd(self.touch_key(pk), True, self.touch_interval):
+            await ChatSession.objects.filter(pk=pk).aupdate(last_activity=timezone.now())
+
+    def forget(self, session_id):
+        """Drop the cached pk, e.g. once the session row is deleted"""
+        self.cache.delete(self.pk_key(session_id))
+
+
+session_resolver = SessionResolver()
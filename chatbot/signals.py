@@ -0,0 +1,17 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import FAQ, ChatSession
+from .services import faq_matcher
+from .sessions import session_resolver
+
+@receiver(post_save, sender=FAQ)
+@receiver(post_delete, sender=FAQ)
+def invalidate_faq_matcher(sender, **kwargs):
+    """Rebuild the compiled FAQ matcher once the change is committed"""
+    transaction.on_commit(faq_matcher.invalidate)
+
+@receiver(post_delete, sender=ChatSession)
+def forget_chat_session(sender, instance, **kwargs):
+    """Stop resolving a deleted session id to its old pk"""
+    session_resolver.forget(instance.session_id)
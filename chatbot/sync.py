@@ -0,0 +1,169 @@
+"""
+Bulk FAQ import: load records from JSON or CSV and sync them into the FAQ table
+"""
+import csv
+import io
+import json
+import os
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_slug
+from django.db import transaction
+from django.utils import timezone
+from .models import FAQ
+from .services import faq_matcher
+
+INITIAL_FAQS_PATH = os.path.join(os.path.dirname(__file__), 'data', 'initial_faqs.json')
+
+SYNCED_FIELDS = ('question', 'answer', 'keywords', 'is_active')
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y', 'on')
+
+
+def clean_record(number, data):
+    """Validate one raw record, returning it normalized or raising ValueError"""
+    if not isinstance(data, dict):
+        raise ValueError(f"Record {number}: expected an object")
+    question = str(data.get('question') or '').strip()
+    answer = str(data.get('answer') or '').strip()
+    if not question or not answer:
+        raise ValueError(f"Record {number}: question and answer are required")
+    keywords = data.get('keywords') or ''
+    if isinstance(keywords, (list, tuple)):
+        keywords = ','.join(str(keyword) for keyword in keywords)
+    return {
+        'key': str(data.get('key') or '').strip() or None,
+        'question': question,
+        'answer': answer,
+        'keywords': str(keywords).strip(),
+        'is_active': parse_bool(data['is_active']) if data.get('is_active') not in (None, '') else True,
+    }
+
+
+def validate_keys(records):
+    """Raise ValueError unless every key is a slug that fits FAQ.key and appears once"""
+    max_length = FAQ._meta.get_field('key').max_length
+    seen = set()
+    for number, record in enumerate(records, start=1):
+        key = record['key']
+        if key is None:
+            continue
+        try:
+            validate_slug(key)
+        except ValidationError:
+            raise ValueError(f"Record {number}: key {key!r} must only contain letters, numbers, hyphens or underscores")
+        if len(key) > max_length:
+            raise ValueError(f"Record {number}: key is longer than {max_length} characters")
+        if key in seen:
+            raise ValueError(f"Record {number}: duplicate key {key!r} in the import")
+        seen.add(key)
+
+
+def load_faq_records(source, format=None, name=''):
+    """
+    Read FAQ records from a text or binary file object.
+
+    JSON is a list of objects (or {"faqs": [...]}), CSV needs a header row;
+    both use the fields key, question, answer, keywords and is_active. The
+    format is taken from the file name when not given. Raises ValueError.
+    """
+    format = format or os.path.splitext(name)[1].lstrip('.').lower() or 'json'
+    content = source.read()
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+
+    if format == 'json':
+        try:
+            data = json.loads(content)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON: {e}")
+        if isinstance(data, dict):
+            data = data.get('faqs')
+        if not isinstance(data, list):
+            raise ValueError("JSON must be a list of FAQs or an object with a 'faqs' list")
+    elif format == 'csv':
+        data = list(csv.DictReader(io.StringIO(content)))
+    else:
+        raise ValueError(f"Unsupported format: {format}")
+
+    records = [clean_record(number, raw) for number, raw in enumerate(data, start=1)]
+
+    validate_keys(records)
+    questions = [record['question'] for record in records if not record['key']]
+    if len(questions) != len(set(questions)):
+        raise ValueError("Duplicate questions without a key in the import")
+    return records
+
+
+def load_initial_faqs():
+    with open(INITIAL_FAQS_PATH, encoding='utf-8') as source:
+        return load_faq_records(source, 'json')
+
+
+def sync_faqs(records, deactivate_missing=False, dry_run=False, batch_size=500):
+    """
+    Make the FAQ table match records in one transaction, returning counts.
+
+    Rows are matched by key, falling back to the exact question (rows
+    matched that way adopt the record's key). Matched rows are updated in
+    place, so ChatMessage.matched_faq links survive, and rows missing from
+    the import are left alone unless deactivate_missing is set. Nothing
+    is ever deleted. Raises ValueError for keys that are not slugs or that
+    appear more than once, before anything is written.
+    """
+    validate_keys(records)
+    counts = {'created': 0, 'updated': 0, 'unchanged': 0, 'deactivated': 0}
+    now = timezone.now()
+
+    with transaction.atomic():
+        existing = list(FAQ.objects.select_for_update())
+        by_key = {faq.key: faq for faq in existing if faq.key}
+        by_question = {}
+        for faq in existing:
+            by_question.setdefault(faq.question, faq)
+
+        seen = set()
+        to_create, to_update = [], []
+        for record in records:
+            faq = by_key.get(record['key']) if record['key'] else None
+            if faq is None:
+                faq = by_question.get(record['question'])
+                if faq is not None and (faq.pk in seen or (faq.key and record['key'] and faq.key != record['key'])):
+                    faq = None  # Already claimed, or a different FAQ that happens to share the question
+
+            if faq is None:
+                to_create.append(FAQ(**record))
+                continue
+
+            seen.add(faq.pk)
+            changed = False
+            for field in SYNCED_FIELDS + (('key',) if record['key'] else ()):
+                if getattr(faq, field) != record[field]:
+                    setattr(faq, field, record[field])
+                    changed = True
+            if changed:
+                faq.updated_at = now
+                to_update.append(faq)
+            else:
+                counts['unchanged'] += 1
+
+        if to_update:
+            FAQ.objects.bulk_update(to_update, ('key',) + SYNCED_FIELDS + ('updated_at',), batch_size=batch_size)
+        if deactivate_missing:
+            missing = [faq.pk for faq in existing if faq.pk not in seen and faq.is_active]
+            counts['deactivated'] = FAQ.objects.filter(pk__in=missing).update(is_active=False, updated_at=now)
+        if to_create:
+            FAQ.objects.bulk_create(to_create, batch_size=batch_size)
+
+        counts['created'] = len(to_create)
+        counts['updated'] = len(to_update)
+        if dry_run:
+            transaction.set_rollback(True)
+        elif to_create or to_update or counts['deactivated']:
+            # Bulk writes send no signals, rebuild the matcher once for the whole import
+            transaction.on_commit(faq_matcher.invalidate)
+
+    return counts
@@ -0,0 +1,51 @@
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from chatbot.models import FAQ, ChatMessage, ChatSession
+
+
+class ChangelistQueryTests(TestCase):
+    """The changelists must cost the same number of queries for one row as for a full page"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.faq = FAQ.objects.create(
+            key='admin-test', question='How do I return an item?', answer='Within 7 days.', keywords='return'
+        )
+
+    def setUp(self):
+        self.client.force_login(self.admin_user)
+
+    def add_sessions(self, count):
+        start = ChatSession.objects.count()
+        for number in range(start, start + count):
+            session = ChatSession.objects.create(session_id=f'admin-{number}')
+            ChatMessage.objects.create(session=session, user_message='return', bot_response='Within 7 days.',
+                                       matched_faq=self.faq, confidence=30)
+            ChatMessage.objects.create(session=session, user_message='xyzzy', bot_response='Sorry.', confidence=0)
+
+    def page_size(self, model):
+        return admin.site._registry[model].list_per_page
+
+    def assertChangelistQueries(self, url_name, num, full_page=False):
+        with self.assertNumQueries(num):
+            response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200)
+        if full_page:
+            changelist = response.context['cl']
+            self.assertEqual(len(changelist.result_list), changelist.list_per_page)
+
+    def test_chat_session_changelist(self):
+        self.add_sessions(1)
+        self.assertChangelistQueries('admin:chatbot_chatsession_changelist', 5)
+        self.add_sessions(self.page_size(ChatSession) - 1)
+        self.assertChangelistQueries('admin:chatbot_chatsession_changelist', 5, full_page=True)
+
+    def test_chat_message_changelist(self):
+        ChatMessage.objects.create(session=ChatSession.objects.create(session_id='admin-single'),
+                                   user_message='return', bot_response='Within 7 days.', matched_faq=self.faq)
+        self.assertChangelistQueries('admin:chatbot_chatmessage_changelist', 6)
+        self.add_sessions(self.page_size(ChatMessage) - 1)
+        self.assertChangelistQueries('admin:chatbot_chatmessage_changelist', 6, full_page=True)
@@ -0,0 +1,38 @@
+from django.test import TestCase, override_settings
+from chatbot.models import ChatSession, ConfidenceRollup, FAQHitRollup
+from chatbot.persistence import chat_message_writer
+from chatbot.services import ChatbotService
+from chatbot.sync import load_initial_faqs, sync_faqs
+
+
+@override_settings(
+    CHATBOT_WRITE_BEHIND=False,
+    CHATBOT_MATCH_CACHE_BACKEND=None,
+    CHATBOT_ANALYTICS_ROLLUPS=True,
+    CHATBOT_WRITE_BEHIND_BATCH_SIZE=100,
+    CHATBOT_WRITE_BEHIND_INTERVAL=60,
+)
+class DeferredRollupTests(TestCase):
+    def setUp(self):
+        sync_faqs(load_initial_faqs())
+        self.session = ChatSession.objects.create(session_id='rollups')
+        self.addCleanup(chat_message_writer.flush_rollups)
+
+    def test_synchronous_turns_are_rolled_up_in_batches(self):
+        service = ChatbotService()
+        with self.captureOnCommitCallbacks(execute=True):
+            for message in ('What is your return policy?', 'How long does shipping take?', 'xyzzy'):
+                service.get_response(message, self.session)
+
+        # Nothing is counted on the request thread
+        self.assertFalse(ConfidenceRollup.objects.exists())
+        self.assertEqual(chat_message_writer.flush_rollups(), 3)
+        self.assertEqual(sum(ConfidenceRollup.objects.values_list('turns', flat=True)), 3)
+        self.assertEqual(sum(FAQHitRollup.objects.values_list('hits', flat=True)), 2)
+
+    def test_rolled_back_turns_are_not_counted(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            ChatbotService().get_response('What is your return policy?', self.session)
+        # The request's transaction never committed, so the callbacks are dropped
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(chat_message_writer.flush_rollups(), 0)
@@ -0,0 +1,89 @@
+import asyncio
+import time
+from unittest import mock
+from django.test import AsyncClient, TransactionTestCase, override_settings
+from django.urls import reverse
+from chatbot.cache import match_cache
+from chatbot.models import ChatMessage
+from chatbot.services import ChatbotService, faq_matcher
+from chatbot.sync import load_initial_faqs, sync_faqs
+
+REPLIES = {
+    'What is your return policy?': 'Our return policy',
+    'hello': 'Hello! How can I help you today?',
+    'How do I track my order?': "You can track your order",
+}
+
+
+# The matcher executor reads the FAQs on its own connection, so they must be committed
+@override_settings(CHATBOT_WRITE_BEHIND=False, CHATBOT_MATCH_CACHE_BACKEND=None, CHATBOT_ANALYTICS_ROLLUPS=False)
+class AsyncChatAPIViewTests(TransactionTestCase):
+    def setUp(self):
+        sync_faqs(load_initial_faqs())
+        faq_matcher.invalidate()
+        match_cache.reset()
+        self.url = reverse('chatbot:chat_api_async')
+
+    def tearDown(self):
+        faq_matcher.invalidate()
+        match_cache.reset()
+
+    async def chat(self, client, message, session_id):
+        response = await client.post(
+            self.url, {'message': message, 'session_id': session_id}, content_type='application/json'
+        )
+        return response.status_code, response.json()
+
+    async def test_concurrent_sessions_get_their_replies(self):
+        client = AsyncClient()
+        messages = [message for _ in range(20) for message in REPLIES]
+        results = await asyncio.gather(*(
+            self.chat(client, message, f'session-{number}') for number, message in enumerate(messages)
+        ))
+
+        for number, (message, (status, data)) in enumerate(zip(messages, results)):
+            self.assertEqual(status, 200)
+            self.assertEqual(data['session_id'], f'session-{number}')
+            self.assertTrue(data['response'].startswith(REPLIES[message]), data['response'])
+        self.assertEqual(await ChatMessage.objects.acount(), len(messages))
+
+    async def test_matching_does_not_block_the_event_loop(self):
+        build_response = ChatbotService.build_response
+
+        def slow_build_response(service, user_message, engine=None):
+            time.sleep(0.2)  # Stands in for CPU-bound matching on a large FAQ set
+            return build_response(service, user_message, engine)
+
+        gaps = []
+
+        async def ticker(stop):
+            last = time.perf_counter()
+            while not stop.is_set():
+                await asyncio.sleep(0.01)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        client = AsyncClient()
+        stop = asyncio.Event()
+        with mock.patch.object(ChatbotService, 'build_response', slow_build_response):
+            ticking = asyncio.create_task(ticker(stop))
+            started = time.perf_counter()
+            results = await asyncio.gather(*(
+                self.chat(client, 'What is your return policy?', f'slow-{number}') for number in range(12)
+            ))
+            elapsed = time.perf_counter() - started
+            stop.set()
+            await ticking
+
+        self.assertEqual([status for status, data in results], [200] * 12)
+        # The loop kept ticking while requests were being matched
+        self.assertLess(max(gaps), 0.1)
+        # Requests were matched side by side, not one after another (12 x 0.2s)
+        self.assertLess(elapsed, 12 * 0.2 / 2)
+
+    async def test_executor_threads_release_their_connections(self):
+        with mock.patch('chatbot.services.close_old_connections') as close_old_connections:
+            status, data = await self.chat(AsyncClient(), 'hello', 'connections')
+        self.assertEqual(status, 200)
+        self.assertEqual(close_old_connections.call_count, 2)
@@ -0,0 +1,110 @@
+import os
+import random
+import tempfile
+from django.test import TestCase, override_settings
+from chatbot.benchmark import WORKLOADS, generate_faqs, generate_messages
+from chatbot.compiled import MappedFAQIndex, compile_faq_index
+from chatbot.models import FAQ
+from chatbot.services import ChatbotService, FAQIndex, typo_budget
+from chatbot.sync import load_initial_faqs, sync_faqs
+
+MESSAGES = [
+    'refunds', 'returns?', 'exchanges', 'tracking number', 'customized sofa', 'phones', 'need helpline',
+    'returning an item', 'What is your return policy?', 'how long does shipping take', 'my order is broken',
+    'a', 'is it', 'xyzzy', '', 'return return return', 'talk to someone about my order please!',
+]
+
+
+def baseline_best_match(faqs, processed_message):
+    """The original full-scan scorer, the reference the index must agree with"""
+    words_in_message = processed_message.split()
+    best_match = None
+    max_score = 0
+    for faq in faqs:
+        score = 0
+        keywords = faq.get_keywords_list()
+        question_words = faq.question.lower().split()
+        for keyword in keywords:
+            if keyword in processed_message:
+                score += 3
+            else:
+                for word in words_in_message:
+                    if keyword in word or word in keyword:
+                        score += 1
+        for word in question_words:
+            if len(word) > 2 and word.lower() in processed_message:
+                score += 2
+        common_words = set(words_in_message) & set(question_words + keywords)
+        if len(common_words) > 1:
+            score += len(common_words)
+        if score > max_score and score > 0:
+            max_score = score
+            best_match = faq
+    return best_match, max_score
+
+
+# Typo tolerance deliberately goes beyond the original scorer, compare without it
+@override_settings(CHATBOT_FUZZY_MAX_CANDIDATES=0)
+class IndexParityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        sync_faqs(load_initial_faqs())
+        rng = random.Random(0)
+        FAQ.objects.bulk_create(generate_faqs(300, rng))
+        cls.messages = list(MESSAGES)
+        for workload in WORKLOADS:
+            cls.messages += generate_messages(workload, 100, rng)
+
+    def assertSameMatches(self, faqs, index):
+        service = ChatbotService()
+        for message in self.messages:
+            processed_message = service.preprocess_message(message)
+            expected_faq, expected_score = baseline_best_match(faqs, processed_message)
+            faq, score = index.best_match(processed_message)
+            with self.subTest(message=message):
+                self.assertEqual(score, expected_score)
+                self.assertEqual(getattr(faq, 'id', None), getattr(expected_faq, 'id', None))
+
+    def test_seed_faqs(self):
+        faqs = list(FAQ.objects.filter(is_active=True, key__isnull=False))
+        self.assertSameMatches(faqs, FAQIndex(faqs))
+
+    def test_synthetic_faqs(self):
+        faqs = list(FAQ.objects.filter(is_active=True))
+        self.assertSameMatches(faqs, FAQIndex(faqs))
+
+    def test_compiled_index(self):
+        faqs = list(FAQ.objects.filter(is_active=True))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'faqs.idx')
+            compile_faq_index(faqs, path)
+            index = MappedFAQIndex(path)
+            self.assertSameMatches(faqs, index)
+            for faq in faqs:
+                self.assertEqual(index.faqs_by_id.get(faq.id).question, faq.question)
+            self.assertIsNone(index.faqs_by_id.get(max(faq.id for faq in faqs) + 1))
+
+
+class TypoToleranceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        sync_faqs(load_initial_faqs())
+
+    def test_misspelled_keywords_match(self):
+        faqs = list(FAQ.objects.filter(is_active=True))
+        index = FAQIndex(faqs)
+        service = ChatbotService()
+        for message, key in (('shiping time', 'shipping-time'), ('retrun policy', 'return-policy')):
+            with self.subTest(message=message):
+                faq, score = index.best_match(service.preprocess_message(message))
+                self.assertEqual(faq.key, key)
+
+    def test_short_words_do_not_match_with_a_typo(self):
+        FAQ.objects.create(key='where-order', question='Where is my parcel?', answer='Track it.', keywords='where,parcel')
+        index = FAQIndex(list(FAQ.objects.filter(is_active=True)))
+        service = ChatbotService()
+        for word in ('ship', 'there'):
+            self.assertEqual(typo_budget(word), 0)
+        self.assertEqual(index.similar_terms(['there', 'ship']), {'there': frozenset(), 'ship': frozenset()})
+        faq, score = index.best_match(service.preprocess_message('there'))
+        self.assertIsNone(faq)
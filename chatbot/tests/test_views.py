@@ -0,0 +1,27 @@
+import json
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from chatbot.models import ChatMessage
+
+
+@override_settings(CHATBOT_WRITE_BEHIND=False, CHATBOT_ANALYTICS_ROLLUPS=False)
+class ChatBatchAPIViewTests(TestCase):
+    def post(self, messages):
+        return self.client.post(
+            reverse('chatbot:chat_batch_api'),
+            json.dumps({'session_id': 'batch', 'messages': messages}),
+            content_type='application/json',
+        )
+
+    def test_answers_every_message(self):
+        response = self.post(['hello', ' return policy '])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([reply['message'] for reply in response.json()['responses']], ['hello', 'return policy'])
+
+    def test_rejects_messages_that_are_not_strings(self):
+        for message in ({'text': 'hello'}, 42, None, ['hello']):
+            with self.subTest(message=message):
+                response = self.post(['hello', message])
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['error'], 'Every message must be a string')
+        self.assertFalse(ChatMessage.objects.exists())
@@ -6,6 +6,8 @@ app_name = 'chatbot'
 urlpatterns = [
     path('', views.chatbot_home, name='home'),
     path('api/chat/', views.ChatAPIView.as_view(), name='chat_api'),
+    path('api/chat/async/', views.AsyncChatAPIView.as_view(), name='chat_api_async'),
+    path('api/chat/batch/', views.ChatBatchAPIView.as_view(), name='chat_batch_api'),
     path('api/history/<str:session_id>/', views.chat_history, name='chat_history'),
     path('api/populate-faqs/', views.populate_faqs_view, name='populate_faqs'),
 ]
\ No newline at end of file
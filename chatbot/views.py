@@ -1,64 +1,26 @@
 import json
 import uuid
+from datetime import datetime, timedelta, timezone
+from django.conf import settings
+from django.db.models import Q
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils.decorators import method_decorator
 from django.views import View
 from .models import FAQ, ChatSession, ChatMessage
-from .services import ChatbotService
-
-def populate_initial_faqs():
-    """Populate FAQ database with initial data if empty"""
-    if FAQ.objects.count() > 0:
-        return  # FAQs already exist
-    
-    faqs_data = [
-        {
-            "question": "What is your return policy?",
-            "answer": "Our return policy allows you to request a return within 7 days of your purchase. The product must be in its original condition. Please visit your Purchase History page to start a return request.",
-            "keywords": "return,policy,refund,exchange"
-        },
-        {
-            "question": "How long does shipping take?",
-            "answer": "Standard shipping usually takes 3-5 business days. Express shipping takes 1-2 business days. You can use our Shipping Calculator on the website for a more precise estimate for your pincode.",
-            "keywords": "shipping,delivery,how long,time,when arrive"
-        },
-        {
-            "question": "How can I track my order?",
-            "answer": "You can track your order using the 'Track Shipment' tool on our website. You will need the tracking number that was sent to your email after your purchase was confirmed.",
-            "keywords": "track,order,status,where is my package"
-        },
-        {
-            "question": "Can I request a custom product?",
-            "answer": "Yes! We have a full customization service. You can submit a request through the 'Customization' section of our website, and our vendors will provide you with quotes.",
-            "keywords": "custom,customization,bespoke,made to order,special"
-        },
-        {
-            "question": "My product arrived damaged, what do I do?",
-            "answer": "We're sorry to hear that! Please initiate a return request from your Purchase History page within 7 days of delivery. Select 'Damaged Item' as the reason and upload photos of the damage.",
-            "keywords": "damaged,broken,defective,issue,wrong item"
-        },
-        {
-            "question": "How do I contact customer support?",
-            "answer": "For any issues not covered here, you can reach our human helpline at support@ddecor.com or call us at +91 22 1234 5678 during business hours.",
-            "keywords": "help,support,contact,human,talk to someone,phone,email"
-        }
-    ]
-    
-    for faq_data in faqs_data:
-        FAQ.objects.create(
-            question=faq_data['question'],
-            answer=faq_data['answer'],
-            keywords=faq_data['keywords'],
-            is_active=True
-        )
+from .services import ChatbotService, tfidf_available
+from .sessions import session_resolver
+from .sync import load_initial_faqs, sync_faqs
+
+chatbot_service = ChatbotService()
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
 
 def chatbot_home(request):
     """Render the main chatbot page"""
-    # Populate initial FAQs if database is empty
-    populate_initial_faqs()
+    # FAQs are seeded by the chatbot migrations and updated with sync_faqs, not per visit
     return render(request, 'chatbot/index.html')
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -76,12 +38,9 @@ class ChatAPIView(View):
                 }, status=400)
             
             # Get or create chat session
-            session, created = ChatSession.objects.get_or_create(
-                session_id=session_id
-            )
+            session = session_resolver.resolve(session_id)
             
-            # Process the message using chatbot service
-            chatbot_service = ChatbotService()
+            # Process the message using the shared chatbot service
             response_data = chatbot_service.get_response(user_message, session)
             
             return JsonResponse({
@@ -96,36 +55,201 @@ class ChatAPIView(View):
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
 
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncChatAPIView(View):
+    """ChatAPIView for ASGI deployments, never holding a thread while waiting on I/O"""
+
+    async def post(self, request):
+        try:
+            data = json.loads(request.body)
+            user_message = data.get('message', '').strip()
+            session_id = data.get('session_id', str(uuid.uuid4()))
+            
+            if not user_message:
+                return JsonResponse({
+                    'error': 'Message cannot be empty',
+                    'session_id': session_id
+                }, status=400)
+            
+            # Get or create chat session
+            session = await session_resolver.aresolve(session_id)
+            
+            # Matching is CPU-bound and runs in the bounded matcher executor
+            response_data = await chatbot_service.aget_response(user_message, session)
+            
+            return JsonResponse({
+                'response': response_data['response'],
+                'session_id': session_id,
+                'matched_faq_id': response_data.get('matched_faq_id'),
+                'confidence': response_data.get('confidence', 0)
+            })
+            
+        except json.JSONDecodeError:
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=500)
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ChatBatchAPIView(View):
+    def post(self, request):
+        try:
+            data = json.loads(request.body)
+            session_id = data.get('session_id', str(uuid.uuid4()))
+            engine = data.get('engine') or getattr(settings, 'CHATBOT_MATCHING_ENGINE', 'keyword')
+            user_messages = data.get('messages')
+            max_messages = getattr(settings, 'CHATBOT_BATCH_MAX_MESSAGES', 1000)
+
+            if not isinstance(user_messages, list) or not user_messages:
+                return JsonResponse({
+                    'error': 'Messages must be a non-empty list',
+                    'session_id': session_id
+                }, status=400)
+            if len(user_messages) > max_messages:
+                return JsonResponse({
+                    'error': f'At most {max_messages} messages can be sent in one batch',
+                    'session_id': session_id
+                }, status=400)
+
+            if not all(isinstance(message, str) for message in user_messages):
+                return JsonResponse({
+                    'error': 'Every message must be a string',
+                    'session_id': session_id
+                }, status=400)
+            user_messages = [message.strip() for message in user_messages]
+            if not all(user_messages):
+                return JsonResponse({
+                    'error': 'Message cannot be empty',
+                    'session_id': session_id
+                }, status=400)
+            if engine not in ('keyword', 'tfidf'):
+                return JsonResponse({
+                    'error': f'Unknown matching engine: {engine}',
+                    'session_id': session_id
+                }, status=400)
+            if engine == 'tfidf' and not tfidf_available():
+                return JsonResponse({
+                    'error': 'The tfidf engine is not available, it needs numpy and scipy',
+                    'session_id': session_id
+                }, status=400)
+
+            # Get or create chat session
+            session = session_resolver.resolve(session_id)
+
+            responses = chatbot_service.get_responses(user_messages, session, engine)
+
+            return JsonResponse({
+                'session_id': session_id,
+                'responses': [
+                    {
+                        'message': user_message,
+                        'response': response_data['response'],
+                        'matched_faq_id': response_data.get('matched_faq_id'),
+                        'confidence': response_data.get('confidence', 0)
+                    }
+                    for user_message, response_data in zip(user_messages, responses)
+                ]
+            })
+
+        except json.JSONDecodeError:
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=500)
+
 @require_http_methods(["GET"])
 def populate_faqs_view(request):
     """Manual endpoint to populate FAQs"""
     try:
-        # Clear existing FAQs first
-        FAQ.objects.all().delete()
-        populate_initial_faqs()
+        # Sync rather than delete and re-insert, so matched_faq links on past messages survive
+        counts = sync_faqs(load_initial_faqs())
         return JsonResponse({
             'success': True, 
             'message': 'FAQs populated successfully',
-            'count': FAQ.objects.count()
+            'count': FAQ.objects.count(),
+            **counts
         })
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
+def history_epoch(aware):
+    # Timestamps come back naive when USE_TZ is off
+    return EPOCH if aware else EPOCH.replace(tzinfo=None)
+
+def encode_history_cursor(timestamp, message_id):
+    """Opaque cursor for a (timestamp, id) position in a session's history"""
+    delta = timestamp - history_epoch(timestamp.tzinfo is not None)
+    microseconds = (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+    return f"{microseconds}:{message_id}"
+
+def decode_history_cursor(cursor):
+    """Return the (timestamp, id) encoded by encode_history_cursor, ValueError if it is malformed"""
+    microseconds, message_id = cursor.split(':')
+    message_id = int(message_id)
+    # Keep the id within a 64-bit column
+    if not 0 < message_id < 2 ** 63:
+        raise ValueError(f"Invalid history cursor: {cursor}")
+    try:
+        timestamp = history_epoch(settings.USE_TZ) + timedelta(microseconds=int(microseconds))
+    except OverflowError:
+        raise ValueError(f"Invalid history cursor: {cursor}")
+    return timestamp, message_id
+
+def history_entry(message_id, user_message, bot_response, timestamp):
+    return {
+        'user_message': user_message,
+        'bot_response': bot_response,
+        'timestamp': timestamp.isoformat(),
+    }
+
+def stream_history(messages):
+    """Yield the full history as one JSON document, a chunk of rows at a time"""
+    yield '{"history": ['
+    chunk_size = getattr(settings, 'CHATBOT_HISTORY_CHUNK_SIZE', 500)
+    for position, row in enumerate(messages.iterator(chunk_size=chunk_size)):
+        yield (',' if position else '') + json.dumps(history_entry(*row))
+    yield ']}'
+
 @require_http_methods(["GET"])
 def chat_history(request, session_id):
-    """Get chat history for a session"""
+    """Get chat history for a session, a page at a time with ?limit=&before="""
     try:
-        session = ChatSession.objects.get(session_id=session_id)
-        messages = ChatMessage.objects.filter(session=session).order_by('timestamp')
-        
-        history = []
-        for message in messages:
-            history.append({
-                'user_message': message.user_message,
-                'bot_response': message.bot_response,
-                'timestamp': message.timestamp.isoformat(),
-            })
-        
-        return JsonResponse({'history': history})
+        session_pk = ChatSession.objects.values_list('pk', flat=True).get(session_id=session_id)
     except ChatSession.DoesNotExist:
-        return JsonResponse({'error': 'Session not found'}, status=404)
\ No newline at end of file
+        return JsonResponse({'error': 'Session not found'}, status=404)
+
+    messages = ChatMessage.objects.filter(session_id=session_pk).values_list(
+        'id', 'user_message', 'bot_response', 'timestamp'
+    )
+
+    limit = request.GET.get('limit')
+    if limit is None:
+        # Full export, streamed so long sessions are never held in memory
+        return StreamingHttpResponse(
+            stream_history(messages.order_by('timestamp', 'id')),
+            content_type='application/json'
+        )
+
+    try:
+        limit = int(limit)
+        if limit < 1:
+            raise ValueError
+        before = request.GET.get('before')
+        if before:
+            before_timestamp, before_id = decode_history_cursor(before)
+            messages = messages.filter(
+                Q(timestamp__lt=before_timestamp) | Q(timestamp=before_timestamp, id__lt=before_id)
+            )
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit or cursor'}, status=400)
+
+    limit = min(limit, getattr(settings, 'CHATBOT_HISTORY_MAX_LIMIT', 200))
+
+    # Newest first so each page is an index range scan, one extra row tells if there are more
+    rows = list(messages.order_by('-timestamp', '-id')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    rows.reverse()
+
+    return JsonResponse({
+        'history': [history_entry(*row) for row in rows],
+        'next_before': encode_history_cursor(rows[0][3], rows[0][0]) if has_more else None,
+    })
\ No newline at end of file